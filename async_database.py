@@ -0,0 +1,54 @@
+import os
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", 8))
+DB_EXECUTOR_MAX_PENDING = int(os.getenv("DB_EXECUTOR_MAX_PENDING", 100))
+
+
+class AsyncDatabase:
+    """واجهة async لـ Database: الاستعلامات تعمل في executor مخصص بدل حلقة الأحداث
+
+    كل عمليات Database العامة متاحة بنفس الأسماء كـ coroutines، وعدد الطلبات
+    المنتظرة محدود بـ max_pending حتى لا تتراكم الطلبات بلا حد عند بطء القاعدة.
+    """
+
+    def __init__(self, database, max_workers=DB_EXECUTOR_WORKERS, max_pending=DB_EXECUTOR_MAX_PENDING):
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._slots = asyncio.Semaphore(max_pending)
+
+    async def run(self, func, *args, **kwargs):
+        """تشغيل دالة متزامنة في executor القاعدة"""
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.database, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def get_user(self, user_id):
+        """القراءة من الذاكرة المؤقتة مباشرة، والذهاب للـ executor عند الإخفاق فقط"""
+        user = self.database.get_cached_user(user_id)
+        if user is not None:
+            return user
+        return await self.run(self.database._load_user, user_id)
+
+    def close(self):
+        """انتظار انتهاء الاستعلامات الجارية وإغلاق الـ executor"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,115 @@
+"""قياس زمن كل دالة في Database على لاعبين وهميين (يُحذفون بعد القياس)
+
+الاستخدام:
+    python benchmarks/bench_database.py --embedded
+    DATABASE_URL=postgresql://... python benchmarks/bench_database.py --users 2000 --ops 1000
+    python benchmarks/bench_database.py --embedded --only get_user,apply_taps
+"""
+import time
+import random
+import argparse
+from datetime import datetime, timezone
+
+from common import BENCH_USER_BASE, summarize, start_embedded_postgres, delete_bench_users
+
+
+def measure(func, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--embedded', action='store_true', help='Postgres مؤقت عبر pgserver')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--ops', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=100, help='حجم الدفعة للدوال الجماعية')
+    parser.add_argument('--only', help='أسماء دوال مفصولة بفواصل')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    server = start_embedded_postgres() if args.embedded else None
+    # الاستيراد بعد ضبط DATABASE_URL لأن database يقرأه عند الاستيراد
+    from database import db
+
+    random.seed(args.seed)
+    ops = args.ops
+    user_ids = [BENCH_USER_BASE + index for index in range(args.users)]
+    created = list(user_ids)  # كل معرف يُسجَّل يُحذف في النهاية
+
+    def new_user_ids():
+        for user_id in range(BENCH_USER_BASE + args.users, BENCH_USER_BASE + 10 * args.users + 10 * ops):
+            created.append(user_id)
+            yield user_id
+
+    new_ids = new_user_ids()
+    seq = iter(range(1, 10 ** 9))
+    today = datetime.now(timezone.utc).date()
+
+    def some_user():
+        return random.choice(user_ids)
+
+    def batch_of_users():
+        return random.sample(user_ids, min(args.batch, len(user_ids)))
+
+    def referral_pairs():
+        # المدعوون يجب أن يكونوا مسجلين (مفتاح أجنبي) - التسجيل خارج القياس
+        referred = [next(new_ids) for _ in range(ops)]
+        db.bulk_create_or_update_users([{'user_id': user_id, 'username': 'bench'} for user_id in referred])
+        return [(some_user(), user_id) for user_id in referred]
+
+    db.bulk_create_or_update_users([
+        {'user_id': user_id, 'username': f'bench{user_id}', 'first_name': 'Bench'} for user_id in user_ids
+    ])
+
+    cases = {
+        'create_or_update_user': lambda: [(next(new_ids), 'bench', 'Bench') for _ in range(ops)],
+        'bulk_create_or_update_users': lambda: [
+            ([{'user_id': next(new_ids), 'username': 'bench'} for _ in range(args.batch)],) for _ in range(ops // 10)
+        ],
+        'get_user': lambda: [(some_user(),) for _ in range(ops)],
+        '_load_user': lambda: [(some_user(),) for _ in range(ops)],
+        'get_bootstrap': lambda: [(some_user(),) for _ in range(ops)],
+        'update_game_data': lambda: [(some_user(), random.randint(0, 10 ** 6), None, random.randint(0, 1000))
+                                     for _ in range(ops)],
+        'bulk_update_game_data': lambda: [
+            ({user_id: {'balance': random.randint(0, 10 ** 6)} for user_id in batch_of_users()},)
+            for _ in range(ops // 10)
+        ],
+        'apply_taps': lambda: [(some_user(), random.randint(1, 30), next(seq)) for _ in range(ops)],
+        'upsert_daily_stats': lambda: [
+            ({(user_id, today): (10, 10) for user_id in batch_of_users()},) for _ in range(ops // 10)
+        ],
+        'add_referral': referral_pairs,
+        'get_leaderboard': lambda: [(10,) for _ in range(ops)],
+        'get_users_after': lambda: [(random.randint(0, BENCH_USER_BASE), 200) for _ in range(ops)],
+        'get_aggregate_stats': lambda: [() for _ in range(max(ops // 50, 5))],
+        'get_user_count': lambda: [() for _ in range(ops)],
+    }
+    only = set(args.only.split(',')) if args.only else None
+
+    try:
+        for name, make_args in cases.items():
+            if only and name not in only:
+                continue
+            func = getattr(db, name)
+            if name == '_load_user':
+                # قراءة من قاعدة البيانات دائماً (بدون الذاكرة المؤقتة)
+                db.user_cache.clear()
+            args_list = make_args()
+            summary = measure(func, args_list)
+            print(f"{name:<28} n={summary['count']:<6} p50={summary['p50_ms']:7.2f}ms  "
+                  f"p95={summary['p95_ms']:7.2f}ms  p99={summary['p99_ms']:7.2f}ms  mean={summary['mean_ms']:7.2f}ms")
+    finally:
+        delete_bench_users(db, created)
+        db.close()
+        if server is not None:
+            server.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""قياس أداء فهرس المتصدرين في الذاكرة
+
+الاستخدام:
+    python benchmarks/bench_leaderboard.py --users 1000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard_index import LeaderboardIndex
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
+
+
+def measure(name, func, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    print(f"{name:<22} p50={percentile(samples, 50):8.1f}us  p99={percentile(samples, 99):8.1f}us  "
+          f"mean={statistics.mean(samples):8.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--ops', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rows = [(user_id, f"user{user_id}", None, random.randint(0, 5_000_000), 1, 0)
+            for user_id in range(1, args.users + 1)]
+
+    index = LeaderboardIndex()
+    started = time.perf_counter()
+    index.load(rows)
+    print(f"load {args.users:,} users: {time.perf_counter() - started:.2f}s")
+
+    user_ids = [(random.randint(1, args.users),) for _ in range(args.ops)]
+    updates = [(random.randint(1, args.users), {'balance': random.randint(0, 5_000_000)})
+               for _ in range(args.ops)]
+
+    measure("top(10)", index.top, [(10,)] * args.ops)
+    measure("top(100)", index.top, [(100,)] * args.ops)
+    measure("rank(user)", index.rank, user_ids)
+    measure("around(user, 5)", index.around, user_ids)
+    measure("apply_change(balance)", index.apply_change, updates)
+
+
+if __name__ == '__main__':
+    main()
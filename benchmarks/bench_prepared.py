@@ -0,0 +1,138 @@
+"""مقارنة زمن الاستعلامات الساخنة: نص SQL في كل استدعاء مقابل prepared statements
+
+يعمل على اتصال واحد بقاعدة DATABASE_URL، وينشئ لاعبين مؤقتين للقياس ثم يحذفهم.
+
+الاستخدام:
+    DATABASE_URL=postgresql://... python benchmarks/bench_prepared.py --ops 5000
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from common import BENCH_USER_BASE
+from database import DATABASE_URL, CHANGE_COLUMNS
+from postgres_database import PREPARED_STATEMENTS, PostgresDatabase, PreparingConnection
+GAME_FIELDS = ('balance', 'taps_today', 'energy', 'level', 'tap_power')
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
+
+
+def adhoc_query(name):
+    """نص الاستعلام بمعاملات psycopg2 بدل $n (كما كان يُرسل قبل التحضير)"""
+    return re.sub(r'\$(\d+)', r'%(p\1)s', PREPARED_STATEMENTS[name][1])
+
+
+def adhoc_update_game_data(cursor, user_id, **fields):
+    """التنفيذ السابق: استعلام يُبنى من الحقول غير الفارغة (حتى 31 شكلاً)"""
+    updates, params = [], []
+    for name in GAME_FIELDS:
+        if fields.get(name) is not None:
+            updates.append(f"{name} = %s")
+            params.append(fields[name])
+            if name == 'energy':
+                updates.append("energy_updated_at = CURRENT_TIMESTAMP")
+    updates.append("last_active = CURRENT_TIMESTAMP")
+    params.append(user_id)
+    cursor.execute(f"UPDATE users SET {', '.join(updates)} WHERE user_id = %s RETURNING {CHANGE_COLUMNS}", params)
+    cursor.fetchall()
+
+
+def measure(conn, func, ops):
+    samples = []
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        for index in range(ops):
+            started = time.perf_counter()
+            func(cursor, index)
+            conn.commit()
+            samples.append((time.perf_counter() - started) * 1_000_000)
+    return samples
+
+
+def report(name, before, after):
+    print(f"{name:<18} ad-hoc p50={percentile(before, 50):7.1f}us p99={percentile(before, 99):7.1f}us | "
+          f"prepared p50={percentile(after, 50):7.1f}us p99={percentile(after, 99):7.1f}us | "
+          f"x{statistics.mean(before) / statistics.mean(after):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    conn = psycopg2.connect(DATABASE_URL, connection_factory=PreparingConnection)
+    user_ids = [BENCH_USER_BASE + index for index in range(args.users)]
+    with conn.cursor() as cursor:
+        cursor.executemany("INSERT INTO users (user_id, username) VALUES (%s, 'bench') ON CONFLICT DO NOTHING",
+                           [(user_id,) for user_id in user_ids])
+    conn.commit()
+
+    def random_fields():
+        # مجموعة حقول عشوائية غير فارغة كما يرسلها العملاء المختلفون
+        chosen = random.sample(GAME_FIELDS, random.randint(1, len(GAME_FIELDS)))
+        return {name: random.randint(1, 1000) for name in chosen}
+
+    seq = [int(time.time() * 1000)]
+
+    def next_seq():
+        seq[0] += 1
+        return seq[0]
+
+    today = datetime.now(timezone.utc).date()
+    get_user_sql = adhoc_query('get_user')
+    leaderboard_sql = adhoc_query('get_leaderboard')
+    apply_taps_sql = adhoc_query('apply_taps')
+    cases = {
+        'get_user': (
+            lambda cur, i: (cur.execute(get_user_sql, {'p1': user_ids[i % args.users]}), cur.fetchone()),
+            lambda cur, i: (PostgresDatabase._execute_prepared(cur, 'get_user', (user_ids[i % args.users],)),
+                            cur.fetchone()),
+        ),
+        'get_leaderboard': (
+            lambda cur, i: (cur.execute(leaderboard_sql, {'p1': 10}), cur.fetchall()),
+            lambda cur, i: (PostgresDatabase._execute_prepared(cur, 'get_leaderboard', (10,)), cur.fetchall()),
+        ),
+        'update_game_data': (
+            lambda cur, i: adhoc_update_game_data(cur, user_ids[i % args.users], **random_fields()),
+            lambda cur, i: (PostgresDatabase._execute_prepared(cur, 'update_game_data', (
+                user_ids[i % args.users], *(random_fields().get(name) for name in GAME_FIELDS))), cur.fetchall()),
+        ),
+        'apply_taps': (
+            lambda cur, i: (cur.execute(apply_taps_sql, {'p1': user_ids[i % args.users], 'p2': 1,
+                                                         'p3': next_seq(), 'p4': today}), cur.fetchone()),
+            lambda cur, i: (PostgresDatabase._execute_prepared(
+                cur, 'apply_taps', (user_ids[i % args.users], 1, next_seq(), today)), cur.fetchone()),
+        ),
+    }
+
+    try:
+        for name, (adhoc, prepared) in cases.items():
+            # تسخين قصير لكل طريقة قبل القياس
+            measure(conn, adhoc, 100)
+            measure(conn, prepared, 100)
+            report(name, measure(conn, adhoc, args.ops), measure(conn, prepared, args.ops))
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM users WHERE user_id = ANY(%s)", (user_ids,))
+        conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""قياس زمن بدء التشغيل البارد - كل تشغيل في عملية Python جديدة كما بعد إعادة التشغيل
+
+لكل تشغيل يُقاس:
+    import database   - يجب أن يكون رخيصاً (بدون اتصال ولا DDL)
+    ensure_ready      - فتح الاتصال وترحيل المخطط (أول تشغيل) أو فحص الإصدار فقط (بعده)
+    legacy_ddl        - للمقارنة: تنفيذ كل CREATE ... IF NOT EXISTS كما كان يحدث عند كل تشغيل
+    import bot        - بقية الاستيرادات (تيليجرام، aiohttp ...)
+
+الاستخدام:
+    python benchmarks/bench_startup.py --embedded
+    python benchmarks/bench_startup.py --sqlite
+    DATABASE_URL=postgresql://... python benchmarks/bench_startup.py --runs 10
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+
+from common import ROOT, summarize, start_embedded_postgres
+
+
+def child():
+    """عملية القياس: تطبع النتائج كـ JSON في سطر واحد"""
+    started = time.perf_counter()
+    import database
+    imported = time.perf_counter()
+    database.db.ensure_ready()
+    ready = time.perf_counter()
+
+    from migrations import MIGRATIONS
+    dialect = 'sqlite' if database.DATABASE_URL.startswith('sqlite:') else 'postgres'
+    statements = [statement for migration in MIGRATIONS for statement in getattr(migration, dialect)
+                  if 'IF NOT EXISTS' in statement]
+    legacy_started = time.perf_counter()
+    with database.db.get_connection() as conn:
+        cursor = conn.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+    legacy = time.perf_counter() - legacy_started
+
+    bot_started = time.perf_counter()
+    import bot  # يشمل بقية الاستيرادات وإنشاء الخدمات
+    bot_imported = time.perf_counter()
+    database.db.close()
+    print(json.dumps({
+        'import_database': imported - started,
+        'ensure_ready': ready - imported,
+        'legacy_ddl': legacy,
+        'import_bot': bot_imported - bot_started,
+        'schema_version': database.db.schema_version,
+    }))
+
+
+def run_child():
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--embedded', action='store_true', help='Postgres مؤقت وفارغ عبر pgserver')
+    parser.add_argument('--sqlite', action='store_true', help='ملف SQLite مؤقت وفارغ')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    server = start_embedded_postgres() if args.embedded else None
+    if args.sqlite:
+        os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp(prefix='bench-sqlite-')}/startup.db"
+
+    try:
+        first = run_child()
+        print(f"أول تشغيل (v{first['schema_version']}): import database={first['import_database'] * 1000:.1f}ms  "
+              f"ensure_ready={first['ensure_ready'] * 1000:.1f}ms  import bot={first['import_bot'] * 1000:.1f}ms")
+
+        results = [run_child() for _ in range(args.runs)]
+        for key in ('import_database', 'ensure_ready', 'legacy_ddl', 'import_bot'):
+            summary = summarize([result[key] for result in results])
+            print(f"{key:<16} n={summary['count']:<3} p50={summary['p50_ms']:8.2f}ms  mean={summary['mean_ms']:8.2f}ms")
+    finally:
+        if server is not None:
+            server.cleanup()
+
+
+if __name__ == '__main__':
+    main()
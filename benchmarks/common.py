@@ -0,0 +1,57 @@
+"""أدوات مشتركة لسكربتات القياس: النسب المئوية وقاعدة Postgres مؤقتة"""
+import os
+import sys
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# معرفات اللاعبين الوهميين في القياسات: معرفات تيليجرام لا تتجاوز 52 بت، فلا يمكن أن يملك
+# لاعب حقيقي معرفاً من 2^62 فما فوق (ويبقى ضمن BIGINT ومسارات \d+)
+BENCH_USER_BASE = 2 ** 62
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
+
+
+def summarize(samples):
+    """p50/p95/p99 والمتوسط بالملي ثانية لعينات بالثواني"""
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        'mean_ms': round(statistics.mean(samples) * 1000, 2),
+    }
+
+
+def start_embedded_postgres():
+    """تشغيل Postgres مؤقت (يتطلب pgserver) وضبط DATABASE_URL قبل استيراد database
+
+    يعيد كائن الخادم - يجب الإبقاء عليه حياً طوال القياس، ويُحذف مع مجلده عند الانتهاء.
+    """
+    try:
+        import pgserver
+    except ImportError:
+        sys.exit("--embedded يتطلب pgserver: pip install pgserver")
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="bench-pg-"), cleanup_mode='delete')
+    os.environ['DATABASE_URL'] = server.get_uri()
+    return server
+
+
+def delete_bench_users(database, user_ids, chunk=1000):
+    """حذف اللاعبين الوهميين الذين أنشأهم القياس فقط (وبياناتهم المرتبطة بـ ON DELETE CASCADE)"""
+    user_ids = sorted({int(user_id) for user_id in user_ids if user_id >= BENCH_USER_BASE})
+    with database.get_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(user_ids), chunk):
+            # أرقام صحيحة فقط في النص، بدون معاملات حتى يعمل مع Postgres و SQLite
+            ids = ', '.join(str(user_id) for user_id in user_ids[start:start + chunk])
+            cursor.execute(f"DELETE FROM users WHERE user_id IN ({ids})")
+    database.user_cache.clear()
@@ -0,0 +1,169 @@
+"""اختبار حمل لواجهة الويب: N عميل يتصرفون مثل تطبيق الويب الحقيقي
+
+كل عميل يحمّل حالته الأولى (GET /api/bootstrap) ثم يرسل دفعة نقراته كل 3 ثوانٍ
+(POST /api/taps) كما يفعل الـ JavaScript. النتيجة: معدل الطلبات و p50/p95/p99 لكل مسار.
+
+بدون --url يُشغَّل خادم الويب في عملية منفصلة على منفذ محلي، ومع
+--embedded يُشغَّل أيضاً Postgres مؤقت (pgserver) بدل DATABASE_URL.
+
+الاستخدام:
+    python benchmarks/loadtest.py --embedded --clients 500 --duration 30
+    DATABASE_URL=postgresql://... python benchmarks/loadtest.py --clients 1000 --interval 1
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --clients 200
+"""
+import os
+import sys
+import time
+import json
+import random
+import signal
+import socket
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+
+from common import BENCH_USER_BASE, summarize, start_embedded_postgres, delete_bench_users
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+
+async def timed_request(session, stats, route, method, url, **kwargs):
+    started = time.perf_counter()
+    try:
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.read()
+            stats.record(route, time.perf_counter() - started, response.status < 400)
+            return json.loads(body) if response.status < 400 else None
+    except Exception:
+        stats.record(route, time.perf_counter() - started, False)
+        return None
+
+
+async def client(session, base_url, user_id, stats, args, deadline):
+    """عميل واحد: تحميل ثم دفعة نقرات كل interval ثانية حتى انتهاء المدة"""
+    # توزيع بدايات العملاء حتى لا تصل كل الدفعات في نفس اللحظة
+    await asyncio.sleep(random.uniform(0, args.interval))
+    # نفس طلب الفتح في تطبيق الويب: الحالة والمهام والترتيب في استعلام واحد
+    state = await timed_request(session, stats, 'GET /api/bootstrap', 'GET', f"{base_url}/api/bootstrap/{user_id}")
+    seq = (state or {}).get('last_seq', 0)
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(args.interval)
+        seq += 1
+        taps = random.randint(args.min_taps, args.max_taps)
+        await timed_request(session, stats, 'POST /api/taps', 'POST', f"{base_url}/api/taps",
+                            json={'user_id': user_id, 'taps': taps, 'seq': seq})
+
+
+async def run_clients(base_url, args):
+    import aiohttp
+
+    stats = Stats()
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    deadline = time.monotonic() + args.duration
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(
+            client(session, base_url, BENCH_USER_BASE + index, stats, args, deadline)
+            for index in range(args.clients)
+        ))
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(samples) for samples in stats.latencies.values())
+    print(f"{args.clients} clients, {elapsed:.1f}s, {total} requests, {total / elapsed:.1f} req/s")
+    for route, samples in sorted(stats.latencies.items()):
+        summary = summarize(samples)
+        print(f"  {route:<18} n={summary['count']:<7} err={stats.errors[route]:<5} "
+              f"rps={summary['count'] / elapsed:8.1f}  p50={summary['p50_ms']:7.2f}ms  "
+              f"p95={summary['p95_ms']:7.2f}ms  p99={summary['p99_ms']:7.2f}ms")
+
+
+def serve(port, clients):
+    """عملية الخادم: تسجيل اللاعبين الوهميين ثم تشغيل تطبيق الويب فقط (بدون تيليجرام)"""
+    from aiohttp import web
+    import bot
+
+    bot.db.bulk_create_or_update_users([
+        {'user_id': BENCH_USER_BASE + index, 'username': f'bench{index}', 'first_name': 'Bench'}
+        for index in range(clients)
+    ])
+    bot.daily_stats_buffer.start()
+    bot.task_buffer.start()
+    bot.leaderboard_index.load(bot.db.get_ranking_rows())
+    try:
+        web.run_app(bot.create_web_app(), host='127.0.0.1', port=port, access_log=None, print=None)
+    finally:
+        bot.daily_stats_buffer.close()
+        bot.task_buffer.close()
+        delete_bench_users(bot.db, [BENCH_USER_BASE + index for index in range(clients)])
+        bot.adb.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit("توقف الخادم قبل أن يبدأ")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("لم يبدأ الخادم خلال المهلة")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='خادم قائم - بدونه يُشغَّل خادم محلي')
+    parser.add_argument('--embedded', action='store_true', help='Postgres مؤقت عبر pgserver')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--interval', type=float, default=3.0, help='الفاصل بين دفعات النقرات (كما في الـ JS)')
+    parser.add_argument('--min-taps', type=int, default=5)
+    parser.add_argument('--max-taps', type=int, default=30)
+    parser.add_argument('--connections', type=int, default=100, help='حد اتصالات HTTP المتزامنة')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.clients)
+        return
+
+    random.seed(args.seed)
+    if args.url:
+        asyncio.run(run_clients(args.url.rstrip('/'), args))
+        return
+
+    server = start_embedded_postgres() if args.embedded else None
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port),
+                                '--clients', str(args.clients)], env=os.environ.copy())
+    try:
+        wait_for_port(port, process)
+        asyncio.run(run_clients(f"http://127.0.0.1:{port}", args))
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait()
+        if server is not None:
+            server.cleanup()
+
+
+if __name__ == '__main__':
+    main()
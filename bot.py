@@ -1,10 +1,32 @@
 import logging
 import os
+import json
+import signal
+import asyncio
+import time
+import hmac
+import secrets
+from datetime import date, datetime
+from functools import partial, wraps
 from telegram import Update, WebAppInfo, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes
-from flask import Flask, render_template_string, request, jsonify
-import threading
+from aiohttp import web
 from database import db
+from write_behind import DailyStatsBuffer, TaskCompletionBuffer, BIGINT_MAX
+from tasks import TaskEngine
+from leaderboard_index import LeaderboardIndex
+from period_leaderboards import PERIODS, PeriodLeaderboards
+from change_feed import ChangeFeed
+from async_database import AsyncDatabase
+from broadcast import BroadcastEngine
+from stats_service import StatsService
+from webapp_assets import PrecompressedAsset
+from update_dispatcher import UpdateDispatcher
+from throttle import SlidingWindowLimiter, ConcurrencyLimiter
+from metrics import (
+    REGISTRY, CONTENT_TYPE, HTTP_REQUEST_SECONDS, HTTP_THROTTLED, HTTP_DB_IN_FLIGHT, HANDLER_SECONDS,
+    STARTUP_SECONDS, timed
+)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,13 +34,123 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 WEBAPP_URL = os.getenv("WEBAPP_URL", "http://localhost:5000")
 PORT = int(os.getenv("PORT", 5000))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # لتجربة البوت على خادم Bot API محلي/وهمي
 ADMIN_IDS = [123456789]  # ضع معرفك هنا
+MAX_TAPS_PER_BATCH = int(os.getenv("MAX_TAPS_PER_BATCH", 500))  # حد النقرات في طلب واحد
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # العنوان العام للخادم - بدونه يعمل البوت بـ polling
+# بدون سر يستطيع أي أحد إرسال تحديثات مزيفة (حتى أوامر المشرفين) - يُولَّد سر عشوائي إذا لم يُضبط،
+# لكن مع أكثر من نسخة يجب ضبطه حتى تقبل كل النسخ نفس السر
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PATH = "/telegram/webhook"
+
+# كل المعالجات أوامر (CommandHandler) - لا حاجة لبقية أنواع التحديثات
+ALLOWED_UPDATES = [Update.MESSAGE]
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.config['JSON_SORT_KEYS'] = False  # تسريع استجابة JSON
+# خادم الويب (aiohttp) يعمل على نفس حلقة الأحداث مع البوت
+routes = web.RouteTableDef()
+
+# حدود الطلبات: نافذة منزلقة لكل لاعب، وعدد محدود من الطلبات المتزامنة على القاعدة
+user_limiter = SlidingWindowLimiter()
+db_route_limiter = ConcurrencyLimiter()
+
+# واجهة async لمعالجات تيليجرام حتى لا يوقف استعلام بطيء حلقة الأحداث
+adb = AsyncDatabase(db)
+
+# الرسائل الجماعية تعمل في الخلفية مع حفظ التقدم في قاعدة البيانات
+broadcast_engine = BroadcastEngine(adb)
+
+# إحصائيات المشرف تُحسب في SQL دورياً وتُقرأ من الذاكرة
+stats_service = StatsService(db)
+
+# تجميع النقرات اليومية في الذاكرة وكتابتها في daily_stats دفعة واحدة
+daily_stats_buffer = DailyStatsBuffer(db)
+
+# محرك المهام: يُقيّم التقدم من كل تغيير، والإنجازات تُكتب مع مكافآتها في دفعات
+task_buffer = TaskCompletionBuffer(db)
+task_engine = TaskEngine(task_buffer)
+db.add_change_listener(task_engine.apply_change)
+
+# طابور تحديثات الـ webhook - يُنشأ في run() عند تفعيل WEBHOOK_URL
+update_dispatcher = None
+
+# فهرس المتصدرين في الذاكرة - يُحمّل مرة واحدة ثم يُحدّث مع كل تغيير
+leaderboard_index = LeaderboardIndex()
+db.add_change_listener(leaderboard_index.apply_change)
+
+# متصدرو اليوم والأسبوع من جداول التجميع - محفوظون في الذاكرة حتى تفريغ daily_stats التالي
+period_leaderboards = PeriodLeaderboards(db, daily_stats_buffer)
+
+# تغييرات النسخ الأخرى من البوت عبر LISTEN/NOTIFY (Postgres فقط) - تُطبّق على الذاكرة المحلية
+change_feed = None
+if getattr(db, 'change_feed_enabled', False):
+    change_feed = ChangeFeed(db)
+    change_feed.add_listener(leaderboard_index.apply_change)
+    change_feed.add_event_listener('rollup', period_leaderboards.invalidate)
+    # بعد انقطاع الاتصال قد تكون إشعارات ضاعت: إعادة البناء من القاعدة
+    change_feed.add_event_listener('resync', period_leaderboards.invalidate)
+    change_feed.add_event_listener('resync', lambda: leaderboard_index.load(db.get_ranking_rows()))
+
+# أسماء الفترات المقبولة في أمر /leaderboard
+PERIOD_ALIASES = {'day': 'day', 'today': 'day', 'اليوم': 'day', 'يومي': 'day',
+                  'week': 'week', 'الأسبوع': 'week', 'اسبوع': 'week', 'أسبوعي': 'week'}
+
+async def get_top_players(limit, period='all'):
+    """أفضل اللاعبين: الكلي من الفهرس (أو القاعدة إذا لم يُحمّل بعد)، واليوم/الأسبوع من التجميع"""
+    if period != 'all':
+        leaders = period_leaderboards.cached(period, limit)
+        if leaders is None:
+            leaders = await adb.run(period_leaderboards.top, period, limit)
+        return leaders
+    if leaderboard_index.loaded:
+        return leaderboard_index.top(limit)
+    return await adb.get_leaderboard(limit=limit)
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def json_response(data, status=200, headers=None):
+    """استجابة JSON تدعم التواريخ (أعمدة created_at وغيرها)"""
+    return web.json_response(data, status=status, headers=headers,
+                             dumps=partial(json.dumps, default=_json_default))
+
+def throttled_response(request, status, retry_after, reason):
+    """رفض سريع مع Retry-After (429 لحد اللاعب، 503 لحمل القاعدة)"""
+    HTTP_THROTTLED.inc(labels=(request.match_info.route.resource.canonical, reason))
+    return json_response({'error': 'Too many requests', 'retry_after': retry_after}, status=status,
+                         headers={'Retry-After': str(retry_after)})
+
+def check_user_rate(request, user_id):
+    """None إذا كان الطلب ضمن حد اللاعب، وإلا استجابة 429"""
+    retry_after = user_limiter.hit(user_id)
+    if retry_after:
+        return throttled_response(request, 429, retry_after, 'rate')
+    return None
+
+def db_route(handler):
+    """مسار يصل لقاعدة البيانات: 503 فوري عند تجاوز حد الطلبات المتزامنة بدل انتظار الـ pool"""
+    @wraps(handler)
+    async def wrapper(request):
+        if not db_route_limiter.try_acquire():
+            return throttled_response(request, 503, db_route_limiter.retry_after, 'concurrency')
+        HTTP_DB_IN_FLIGHT.inc()
+        try:
+            return await handler(request)
+        finally:
+            db_route_limiter.release()
+            HTTP_DB_IN_FLIGHT.dec()
+    return wrapper
+
+def query_int(request, name, default):
+    """قراءة رقم من query string مع قيمة افتراضية عند الغياب أو الخطأ"""
+    try:
+        return int(request.query.get(name, default))
+    except ValueError:
+        return default
 
 # نفس HTML_TEMPLATE من الكود السابق
 HTML_TEMPLATE = """
@@ -293,8 +425,13 @@ HTML_TEMPLATE = """
         let level = 1;
         let tapPower = 1;
         let userId = null;
-        let lastSaveTime = 0;
-        const SAVE_INTERVAL = 3000; // حفظ كل 3 ثواني
+        let pendingTaps = 0;        // نقرات لم تُرسل بعد للخادم
+        let tapsInFlight = null;    // الدفعة المرسلة {taps, seq} - تُعاد بنفس seq حتى يؤكدها الخادم
+        let sending = false;
+        let retryAt = 0;            // لا إرسال قبل هذا الوقت (Retry-After من الخادم)
+        let tapSeq = Date.now();    // رقم تسلسلي متزايد لكل دفعة
+        let tasks = {};             // المهام المنجزة من الخادم {task_type: true}
+        const SAVE_INTERVAL = 3000; // إرسال النقرات كل 3 ثواني
 
         let tg = window.Telegram.WebApp;
         tg.expand();
@@ -313,7 +450,7 @@ HTML_TEMPLATE = """
 
         async function loadDataFromServer() {
             try {
-                const response = await fetch('/api/user/' + userId);
+                const response = await fetch('/api/bootstrap/' + userId);
                 if (response.ok) {
                     const data = await response.json();
                     balance = data.balance || 0;
@@ -321,6 +458,8 @@ HTML_TEMPLATE = """
                     energy = data.energy || 1000;
                     level = data.level || 1;
                     tapPower = data.tap_power || 1;
+                    tapSeq = Math.max(tapSeq, (data.last_seq || 0) + 1);
+                    tasks = data.tasks || {};
                     updateDisplay();
                 }
             } catch (error) {
@@ -328,26 +467,47 @@ HTML_TEMPLATE = """
             }
         }
 
-        async function saveDataToServer() {
-            if (!userId || Date.now() - lastSaveTime < SAVE_INTERVAL) return;
-            
-            lastSaveTime = Date.now();
+        async function sendTaps(keepalive = false) {
+            if (!userId || sending || Date.now() < retryAt) return;
+            if (!tapsInFlight) {
+                // دفعة جديدة فقط بعد تأكيد السابقة، وإلا قد تُطبّق نفس النقرات مرتين
+                if (pendingTaps === 0) return;
+                tapSeq += 1;
+                tapsInFlight = {taps: pendingTaps, seq: tapSeq};
+                pendingTaps = 0;
+            }
+            sending = true;
             
             try {
-                await fetch('/api/save', {
+                const response = await fetch('/api/taps', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({
-                        user_id: userId,
-                        balance: balance,
-                        taps_today: tapsToday,
-                        energy: energy,
-                        level: level,
-                        tap_power: tapPower
-                    })
+                    body: JSON.stringify({user_id: userId, taps: tapsInFlight.taps, seq: tapsInFlight.seq}),
+                    keepalive: keepalive
                 });
+                if (response.ok) {
+                    tapsInFlight = null;
+                    // حالة الخادم هي المرجع، مع إضافة النقرات التي حدثت أثناء الطلب
+                    const data = await response.json();
+                    level = data.level;
+                    tapPower = data.tap_power;
+                    balance = data.balance + pendingTaps * tapPower;
+                    tapsToday = data.taps_today + pendingTaps;
+                    energy = Math.max(data.energy - pendingTaps * tapPower, 0);
+                    updateDisplay();
+                } else if (response.status === 400 || response.status === 404) {
+                    // رفضها الخادم - إعادة إرسالها لن تنجح
+                    tapsInFlight = null;
+                } else {
+                    // 429 أو 503 أو غيرها: تبقى الدفعة وتُعاد بعد المدة التي يطلبها الخادم
+                    const retryAfter = Number(response.headers.get('Retry-After'));
+                    retryAt = Date.now() + (retryAfter > 0 ? retryAfter * 1000 : SAVE_INTERVAL);
+                }
             } catch (error) {
+                // ربما طُبّقت وضاع الرد: تبقى الدفعة بنفس seq والخادم يتجاهل المكرر
                 console.error('خطأ في حفظ البيانات:', error);
+            } finally {
+                sending = false;
             }
         }
 
@@ -360,6 +520,7 @@ HTML_TEMPLATE = """
             balance += tapPower;
             tapsToday += 1;
             energy -= tapPower;
+            pendingTaps += 1;
 
             updateDisplay();
             createFloatingCoin(event);
@@ -398,6 +559,7 @@ HTML_TEMPLATE = """
             setTimeout(() => coin.remove(), 1000);
         }
 
+        // تجدد الطاقة للعرض فقط - الخادم يحسبها من الوقت المنقضي دون أي كتابة
         setInterval(() => {
             if (energy < maxEnergy) {
                 energy = Math.min(energy + 1, maxEnergy);
@@ -405,16 +567,19 @@ HTML_TEMPLATE = """
             }
         }, 1000);
 
-        setInterval(() => saveDataToServer(), SAVE_INTERVAL);
+        setInterval(() => sendTaps(), SAVE_INTERVAL);
 
         window.addEventListener('beforeunload', () => {
-            saveDataToServer();
+            sendTaps(true);
         });
 
         function showTasks() {
+            const mark = (task) => tasks[task] ? '✅' : '•';
             tg.showPopup({
                 title: '📋 المهام اليومية',
-                message: '• انقر 100 مرة: +500 💎\\n• ادعُ 3 أصدقاء: +1000 💎\\n• افتح التطبيق 7 أيام: +5000 💎',
+                message: mark('tap_100') + ' انقر 100 مرة: +500 💎\\n' +
+                         mark('invite_3') + ' ادعُ 3 أصدقاء: +1000 💎\\n' +
+                         mark('streak_7') + ' العب 7 أيام متتالية: +5000 💎',
                 buttons: [{type: 'ok'}]
             });
         }
@@ -436,61 +601,184 @@ HTML_TEMPLATE = """
 </html>
 """
 
-@app.route('/')
-def webapp():
-    return render_template_string(HTML_TEMPLATE)
+# القالب ثابت: يُضغط مرة واحدة عند التشغيل بدل كل طلب
+WEBAPP_SHELL = PrecompressedAsset(HTML_TEMPLATE)
+
+@routes.get('/')
+async def webapp(request):
+    status, body, headers = WEBAPP_SHELL.select(
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match')
+    )
+    return web.Response(body=body, status=status, headers=headers)
 
-@app.route('/api/user/<int:user_id>', methods=['GET'])
-def get_user_data(user_id):
+@routes.get(r'/api/user/{user_id:\d+}')
+@db_route
+async def get_user_data(request):
     """API للحصول على بيانات المستخدم"""
     try:
-        user = db.get_user(user_id)
+        user_id = int(request.match_info['user_id'])
+        throttled = check_user_rate(request, user_id)
+        if throttled is not None:
+            return throttled
+        user = await adb.get_user(user_id)
         if user:
-            return jsonify(user), 200
-        return jsonify({'error': 'User not found'}), 404
+            return json_response(user)
+        return json_response({'error': 'User not found'}, status=404)
     except Exception as e:
         logger.error(f"خطأ في جلب البيانات: {e}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, status=500)
+
+@routes.get(r'/api/bootstrap/{user_id:\d+}')
+@db_route
+async def bootstrap(request):
+    """API لكل ما تحتاجه واجهة الويب عند الفتح: حالة اللعبة والترتيب والمهام والدعوات في طلب واحد"""
+    try:
+        user_id = int(request.match_info['user_id'])
+        throttled = check_user_rate(request, user_id)
+        if throttled is not None:
+            return throttled
+        # الترتيب من الفهرس في الذاكرة، ومن SQL فقط قبل تحميله
+        state = await adb.get_bootstrap(user_id, with_rank=not leaderboard_index.loaded)
+        if not state:
+            return json_response({'error': 'User not found'}, status=404)
+        if leaderboard_index.loaded:
+            state['rank'] = leaderboard_index.rank(user_id)
+        return json_response(state)
+    except Exception as e:
+        logger.error(f"خطأ في جلب حالة اللاعب: {e}")
+        return json_response({'error': str(e)}, status=500)
 
-@app.route('/api/save', methods=['POST'])
-def save_game_data():
-    """API لحفظ بيانات اللعبة"""
+@routes.post('/api/taps')
+@db_route
+async def apply_taps(request):
+    """API لاستقبال دفعات النقرات كفروقات (delta) مع رقم تسلسلي من العميل"""
     try:
-        data = request.json
-        user_id = data.get('user_id')
+        try:
+            data = await request.json()
+            user_id = int(data.get('user_id'))
+            taps = int(data.get('taps', 0))
+            seq = int(data.get('seq'))
+        except (TypeError, ValueError, AttributeError):
+            return json_response({'error': 'Invalid data'}, status=400)
+        # قيمة خارج BIGINT تفشل في القاعدة وتعود 503 فيعيدها العميل بلا نهاية
+        if (taps < 0 or taps > MAX_TAPS_PER_BATCH or not 0 < seq <= BIGINT_MAX
+                or not -BIGINT_MAX <= user_id <= BIGINT_MAX):
+            return json_response({'error': 'Invalid data'}, status=400)
+        throttled = check_user_rate(request, user_id)
+        if throttled is not None:
+            return throttled
         
-        # عدم حفظ إذا كانت القيم null
-        db.update_game_data(
-            user_id=user_id,
-            balance=data.get('balance'),
-            taps_today=data.get('taps_today'),
-            energy=data.get('energy'),
-            level=data.get('level'),
-            tap_power=data.get('tap_power')
-        )
+        try:
+            result = await adb.apply_taps(user_id, taps, seq)
+        except Exception:
+            # خطأ مؤقت في القاعدة: العميل يحتفظ بالدفعة ويعيد إرسالها بنفس seq
+            return json_response({'error': 'Database unavailable'}, status=503, headers={'Retry-After': '1'})
+        if result is not None:
+            daily_stats_buffer.record(user_id, result['accepted'], result['earned'])
+        else:
+            # دفعة مكررة أو قديمة: نعيد الحالة الحالية دون تطبيق أي شيء
+            user = await adb.get_user(user_id)
+            if not user:
+                return json_response({'error': 'User not found'}, status=404)
+            result = {field: user[field] for field in
+                      ('balance', 'taps_today', 'energy', 'level', 'tap_power', 'total_taps')}
+            result['accepted'] = 0
         
-        return jsonify({'success': True}), 200
+        return json_response(result)
     except Exception as e:
-        logger.error(f"خطأ في حفظ البيانات: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"خطأ في تطبيق النقرات: {e}")
+        return json_response({'error': str(e)}, status=500)
 
-@app.route('/api/leaderboard', methods=['GET'])
-def leaderboard():
-    """API للحصول على المتصدرين"""
+@routes.get('/api/leaderboard')
+async def leaderboard(request):
+    """API للحصول على المتصدرين (period=all|day|week)"""
     try:
-        limit = request.args.get('limit', 10, type=int)
-        leaders = db.get_leaderboard(limit=min(limit, 100))
-        return jsonify(leaders), 200
+        limit = query_int(request, 'limit', 10)
+        period = request.query.get('period', 'all')
+        if period != 'all' and period not in PERIODS:
+            return json_response({'error': 'Invalid period'}, status=400)
+        leaders = await get_top_players(min(limit, 100), period)
+        return json_response(leaders)
     except Exception as e:
         logger.error(f"خطأ في جلب المتصدرين: {e}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, status=500)
+
+@routes.get(r'/api/rank/{user_id:\d+}')
+async def player_rank(request):
+    """API لترتيب اللاعب واللاعبين من حوله"""
+    try:
+        user_id = int(request.match_info['user_id'])
+        radius = min(query_int(request, 'radius', 5), 50)
+        rank = leaderboard_index.rank(user_id)
+        if rank is None:
+            return json_response({'error': 'User not found'}, status=404)
+        return json_response({
+            'rank': rank,
+            'total': len(leaderboard_index),
+            'around': leaderboard_index.around(user_id, radius=radius)
+        })
+    except Exception as e:
+        logger.error(f"خطأ في جلب الترتيب: {e}")
+        return json_response({'error': str(e)}, status=500)
+
+async def telegram_webhook(request):
+    """استقبال تحديثات تيليجرام ووضعها في الطابور - المعالجة تتم في العمال"""
+    dispatcher = request.app['dispatcher']
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(token.encode(), request.app['webhook_secret'].encode()):
+        return web.Response(status=403)
+    try:
+        update = Update.de_json(await request.json(), dispatcher.application.bot)
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return web.Response(status=400)
+    if update is None:
+        return web.Response(status=400)
+    if not dispatcher.submit(update):
+        # الطابور ممتلئ: تيليجرام يعيد إرسال التحديث لاحقاً
+        return web.Response(status=503, headers={'Retry-After': '1'})
+    return web.Response()
+
+@routes.get('/metrics')
+async def metrics_endpoint(request):
+    """المقاييس بصيغة Prometheus - تُجمع فقط عند الطلب"""
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """قياس زمن كل طلب حسب قالب المسار (وليس الرابط الفعلي حتى لا تتضخم الـ labels)"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, (route, request.method, status))
+
+def create_web_app(dispatcher=None, webhook_secret=None):
+    """إنشاء تطبيق الويب (مع مسار الـ webhook عند تمرير dispatcher والسر)"""
+    web_app = web.Application(middlewares=[metrics_middleware])
+    web_app.add_routes(routes)
+    if dispatcher is not None:
+        if not webhook_secret:
+            raise ValueError("مسار الـ webhook يتطلب سراً")
+        web_app['dispatcher'] = dispatcher
+        web_app['webhook_secret'] = webhook_secret
+        web_app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    return web_app
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """رسالة الترحيب"""
     user = update.effective_user
     
-    invited_by = context.args[0] if context.args else None
-    db.create_or_update_user(
+    invited_by = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+    await adb.create_or_update_user(
         user_id=user.id,
         username=user.username,
         first_name=user.first_name,
@@ -533,15 +821,17 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض إحصائيات اللاعب"""
     user = update.effective_user
-    user_data = db.get_user(user.id)
+    user_data = await adb.get_user(user.id)
     
     if user_data:
+        rank = leaderboard_index.rank(user.id)
         stats_text = (
             f"📊 إحصائياتك:\n\n"
             f"👤 الاسم: {user.first_name}\n"
             f"🆔 المعرف: {user.id}\n"
             f"💎 الرصيد: {user_data['balance']:,}\n"
             f"⭐ المستوى: {user_data['level']}\n"
+            f"🏅 ترتيبك: {f'#{rank:,}' if rank else '-'}\n"
             f"👥 عدد الأصدقاء: {user_data['invited_count']}\n"
             f"📅 انضممت: {user_data['created_at'].strftime('%Y-%m-%d')}"
         )
@@ -561,21 +851,26 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(stats_text, reply_markup=reply_markup)
 
 async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """عرض قائمة المتصدرين"""
-    leaders = db.get_leaderboard(limit=10)
+    """عرض قائمة المتصدرين: /leaderboard للكلي، و /leaderboard day أو week للفترة الحالية"""
+    period = PERIOD_ALIASES.get(context.args[0].lower(), 'all') if context.args else 'all'
+    leaders = await get_top_players(10, period)
     
     if not leaders:
         await update.message.reply_text("📊 لا يوجد متصدرين حتى الآن!")
         return
     
-    leaderboard_text = "🏆 قائمة المتصدرين:\n\n"
+    titles = {'all': "🏆 قائمة المتصدرين:", 'day': "🏆 متصدرو اليوم:", 'week': "🏆 متصدرو الأسبوع:"}
+    leaderboard_text = f"{titles[period]}\n\n"
     
     medals = ["🥇", "🥈", "🥉"]
     for idx, leader in enumerate(leaders):
         medal = medals[idx] if idx < 3 else f"{idx + 1}."
         name = leader['first_name'] or leader['username'] or 'لاعب'
         leaderboard_text += f"{medal} {name}\n"
-        leaderboard_text += f"   💎 {leader['balance']:,} | ⭐ المستوى {leader['level']}\n\n"
+        if period == 'all':
+            leaderboard_text += f"   💎 {leader['balance']:,} | ⭐ المستوى {leader['level']}\n\n"
+        else:
+            leaderboard_text += f"   💰 +{leader['earned']:,} | 👆 {leader['taps']:,} نقرة\n\n"
     
     await update.message.reply_text(leaderboard_text)
 
@@ -585,17 +880,61 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ هذا الأمر للمشرفين فقط!")
         return
     
-    total_users = db.get_user_count()
-    all_users = db.get_all_users()
+    snapshot = stats_service.snapshot
+    if snapshot is None:
+        snapshot = await adb.run(stats_service.refresh)
+    if snapshot is None:
+        await update.message.reply_text("❌ تعذر حساب الإحصائيات حالياً")
+        return
     
-    total_balance = sum(user['balance'] for user in all_users)
+    levels_text = "\n".join(f"   ⭐ {bucket}: {users:,}" for bucket, users in snapshot['level_distribution'])
+    buffer_stats = daily_stats_buffer.stats()
+    cache_stats = db.user_cache.stats()
+    pool_stats = db.pool_stats()
     
     stats_text = (
         "👑 إحصائيات المشرف:\n\n"
-        f"👥 إجمالي المستخدمين: {total_users}\n"
-        f"💎 إجمالي العملات: {total_balance:,}\n"
+        f"👥 إجمالي المستخدمين: {snapshot['total_users']:,}\n"
+        f"💎 إجمالي العملات: {snapshot['total_balance']:,}\n"
+        f"👆 إجمالي النقرات: {snapshot['total_taps']:,}\n\n"
+        f"🟢 نشطون (24 ساعة): {snapshot['active_24h']:,}\n"
+        f"🟢 نشطون (7 أيام): {snapshot['active_7d']:,}\n"
+        f"🆕 جدد (24 ساعة): {snapshot['new_24h']:,}\n"
+        f"🆕 جدد (7 أيام): {snapshot['new_7d']:,}\n\n"
+        f"📈 توزيع المستويات:\n{levels_text}\n\n"
+        f"🕒 عمر الإحصائيات: {int(stats_service.age() or 0)} ثانية\n\n"
+        f"💾 إحصائيات يومية في انتظار الحفظ: {buffer_stats['queue_depth']}\n"
+        f"⏱️ آخر تفريغ: {buffer_stats['last_flush_latency_ms']} ms\n"
+        f"📋 مهام منجزة: {task_engine.completed:,} (في انتظار الكتابة {task_buffer.queue_depth()})\n"
+        f"🗂️ ذاكرة اللاعبين: {cache_stats['size']}/{cache_stats['maxsize']} "
+        f"(إصابة {cache_stats['hit_ratio']:.0%}، إخراج {cache_stats['evictions']})"
     )
-    
+    if pool_stats is not None:
+        stats_text += (
+            f"\n🔌 الاتصالات: {pool_stats['in_use']}/{pool_stats['maxconn']} مستخدمة "
+            f"(انتظار أقصى {pool_stats['max_wait_ms']} ms، مهلات {pool_stats['timeouts']})"
+        )
+    if update_dispatcher is not None:
+        queue_stats = update_dispatcher.stats()
+        stats_text += (
+            f"\n📥 طابور التحديثات: {queue_stats['queue_depth']} (الأقصى {queue_stats['max_depth']}، "
+            f"مرفوض {queue_stats['rejected']})\n"
+            f"⏱️ زمن المعالجة: {queue_stats['avg_latency_ms']} ms (الأقصى {queue_stats['max_latency_ms']} ms)"
+        )
+    rate_stats = user_limiter.stats()
+    concurrency_stats = db_route_limiter.stats()
+    stats_text += (
+        f"\n🚦 مرفوض بحد اللاعب: {rate_stats['rejected']:,} ({rate_stats['limit']}/{rate_stats['window']:g}s)\n"
+        f"🚦 طلبات القاعدة الجارية: {concurrency_stats['in_flight']}/{concurrency_stats['limit']} "
+        f"(الأقصى {concurrency_stats['max_in_flight']}، مرفوض {concurrency_stats['rejected']:,})"
+    )
+    if change_feed is not None:
+        feed_stats = change_feed.stats()
+        stats_text += (
+            f"\n📡 تغييرات النسخ الأخرى: {feed_stats['applied_rows']:,} صف من {feed_stats['received']:,} إشعار "
+            f"({'متصل' if feed_stats['connected'] else 'غير متصل'}، إعادة اتصال {feed_stats['reconnects']})"
+        )
+
     await update.message.reply_text(stats_text)
 
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -612,54 +951,151 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     message = ' '.join(context.args)
-    all_users = db.get_all_users()
+    job_id = await broadcast_engine.submit(message, created_by=update.effective_user.id)
     
-    success = 0
-    failed = 0
+    if job_id is None:
+        await update.message.reply_text("❌ تعذر إنشاء الرسالة الجماعية")
+        return
     
-    for user in all_users:
-        try:
-            await context.bot.send_message(
-                chat_id=user['user_id'],
-                text=f"📢 رسالة من الإدارة:\n\n{message}"
-            )
-            success += 1
-        except Exception as e:
-            failed += 1
-            logger.error(f"فشل الإرسال إلى {user['user_id']}: {e}")
+    await update.message.reply_text(
+        f"📤 بدأ إرسال الرسالة #{job_id} في الخلفية\n\n"
+        f"تابع التقدم: /broadcast_status {job_id}"
+    )
+
+async def broadcast_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """حالة رسالة جماعية (للمشرفين فقط)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ هذا الأمر للمشرفين فقط!")
+        return
+    
+    job_id = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+    job = await adb.get_broadcast_job(job_id)
+    
+    if not job:
+        await update.message.reply_text("📭 لا توجد رسائل جماعية")
+        return
+    
+    if broadcast_engine.is_running(job['id']):
+        status = "⏳ قيد الإرسال"
+    elif job['status'] == 'done':
+        status = "✅ مكتملة"
+    else:
+        status = "⏸️ متوقفة (ستُستأنف عند التشغيل)"
     
     await update.message.reply_text(
-        f"✅ تم إرسال الرسالة\n\n"
-        f"نجح: {success}\n"
-        f"فشل: {failed}"
+        f"📢 الرسالة #{job['id']}: {status}\n\n"
+        f"نجح: {job['sent']}\n"
+        f"فشل: {job['failed']}\n"
+        f"آخر مستخدم: {job['last_user_id']}"
     )
 
-def run_flask():
-    """تشغيل خادم Flask"""
-    app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
+def build_application():
+    """إنشاء تطبيق البوت وتسجيل معالجات الأوامر"""
+    builder = Application.builder().token(BOT_TOKEN)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    application = builder.build()
+    
+    # إضافة معالجات الأوامر (مع قياس زمن كل أمر)
+    commands = {
+        "start": start,
+        "help": help_command,
+        "stats": stats,
+        "leaderboard": leaderboard_command,
+        "admin": admin_stats,
+        "broadcast": broadcast,
+        "broadcast_status": broadcast_status,
+    }
+    for command, callback in commands.items():
+        application.add_handler(CommandHandler(command, timed(HANDLER_SECONDS, command)(callback)))
+    return application
+
+async def run():
+    """تشغيل خادم الويب والبوت معاً على حلقة أحداث واحدة حتى وصول إشارة الإيقاف"""
+    global update_dispatcher
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    application = build_application()
+    webhook_secret = None
+    if WEBHOOK_URL:
+        update_dispatcher = UpdateDispatcher(application)
+        webhook_secret = WEBHOOK_SECRET
+        if not webhook_secret:
+            webhook_secret = secrets.token_urlsafe(32)
+            logger.warning("⚠️ WEBHOOK_SECRET غير مضبوط: تم توليد سر عشوائي لهذه العملية "
+                           "(اضبطه عند تشغيل أكثر من نسخة)")
+    
+    web_runner = web.AppRunner(create_web_app(update_dispatcher, webhook_secret), access_log=None)
+    await web_runner.setup()
+    await web.TCPSite(web_runner, '0.0.0.0', PORT).start()
+    logger.info(f"🌐 خادم الويب يعمل على http://0.0.0.0:{PORT}")
+    
+    try:
+        async with application:
+            if update_dispatcher is not None:
+                update_dispatcher.start()
+                await application.bot.set_webhook(
+                    url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                    secret_token=webhook_secret,
+                    allowed_updates=ALLOWED_UPDATES
+                )
+                logger.info(f"🔗 وضع webhook مع {update_dispatcher.workers} عامل")
+            else:
+                await application.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+            await application.start()
+            # استئناف الرسائل الجماعية غير المكتملة
+            await broadcast_engine.start(application.bot)
+            logger.info("🚀 البوت يعمل الآن...")
+            
+            await stop_event.wait()
+            
+            # إيقاف الرسائل الجماعية (التقدم محفوظ) ثم البوت
+            await broadcast_engine.stop()
+            if update_dispatcher is not None:
+                await update_dispatcher.stop()
+            else:
+                await application.updater.stop()
+            await application.stop()
+    finally:
+        await web_runner.cleanup()
 
 def main():
     """تشغيل البوت"""
-    # تشغيل Flask في خيط منفصل
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    logger.info(f"🌐 خادم الويب يعمل على http://0.0.0.0:{PORT}")
-    
-    # إنشاء التطبيق
-    application = Application.builder().token(BOT_TOKEN).build()
+    started = time.perf_counter()
+    # الاتصال بقاعدة البيانات وترحيل المخطط (فحص الإصدار فقط إذا كان محدّثاً)
+    db.ensure_ready()
     
-    # إضافة معالجات الأوامر
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("stats", stats))
-    application.add_handler(CommandHandler("leaderboard", leaderboard_command))
-    application.add_handler(CommandHandler("admin", admin_stats))
-    application.add_handler(CommandHandler("broadcast", broadcast))
+    # تشغيل مخزن الحفظ المؤجل وتحديث الإحصائيات الدوري
+    daily_stats_buffer.start()
+    task_buffer.start()
+    stats_service.start()
     
-    # بدء البوت
-    logger.info("🚀 البوت يعمل الآن...")
+    # تحميل فهرس المتصدرين قبل استقبال الطلبات - الاستماع يبدأ قبله حتى لا يضيع تغيير بينهما
+    if change_feed is not None:
+        change_feed.listen()
+    leaderboard_index.load(db.get_ranking_rows())
+    if change_feed is not None:
+        change_feed.start()
     logger.info(f"📊 عدد المستخدمين: {db.get_user_count()}")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    
+    if db.startup_seconds is not None:
+        STARTUP_SECONDS.set(db.startup_seconds, ('database',))
+    STARTUP_SECONDS.set(time.perf_counter() - started, ('total',))
+    logger.info(f"🚀 جاهز خلال {(time.perf_counter() - started) * 1000:.0f} ms")
+    
+    try:
+        asyncio.run(run())
+    finally:
+        if change_feed is not None:
+            change_feed.stop()
+        # حفظ كل البيانات المعلقة قبل الخروج
+        daily_stats_buffer.close()
+        task_buffer.close()
+        stats_service.stop()
+        adb.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,229 @@
+import os
+import time
+import asyncio
+import logging
+from telegram.error import RetryAfter, Forbidden, BadRequest, TimedOut, NetworkError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# حدود تيليجرام: ~30 رسالة/ثانية إجمالاً ورسالة واحدة/ثانية لكل محادثة
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", 1.0))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", 200))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", 3))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", 1.0))  # ثواني بين حفظين داخل الدفعة
+
+BROADCAST_TEMPLATE = "📢 رسالة من الإدارة:\n\n{message}"
+
+
+class TokenBucket:
+    """Token bucket غير متزامن - rate رمز في الثانية وبسعة capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # القفل يجعل المنتظرين يخدمون بالترتيب (FIFO)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """إيقاف الإرسال مؤقتاً (عند استلام RetryAfter من تيليجرام)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class RateLimiter:
+    """حد إجمالي (token bucket) مع حد أدنى للفاصل بين رسالتين لنفس المحادثة"""
+
+    def __init__(self, rate=BROADCAST_RATE, per_chat_interval=BROADCAST_PER_CHAT_INTERVAL):
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self._chat_ready_at = {}
+
+    async def acquire(self, chat_id):
+        ready_at = self._chat_ready_at.get(chat_id, 0.0)
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+        now = time.monotonic()
+        self._chat_ready_at[chat_id] = now + self.per_chat_interval
+        if len(self._chat_ready_at) > 10000:
+            self._chat_ready_at = {chat: at for chat, at in self._chat_ready_at.items() if at > now}
+
+    def pause(self, seconds):
+        self.bucket.pause(seconds)
+
+
+class BroadcastProgress:
+    """تقدم مهمة داخل الدفعة: آخر user_id انتهى قبله (وعنده) كل إرسال
+
+    المرسلون المتوازيون ينتهون بغير ترتيب، فلا يتقدم last_user_id إلا على
+    مستخدمين متتاليين انتهى إرسالهم - الاستئناف منه لا يكرر أي رسالة مكتملة
+    ولا يتخطى أي رسالة لم تُرسل.
+    """
+
+    def __init__(self, last_user_id=0, sent=0, failed=0):
+        self.last_user_id = last_user_id
+        self.sent = sent
+        self.failed = failed
+        self._page = []
+        self._next = 0
+        self._results = {}
+
+    def begin_page(self, user_ids):
+        self._page = user_ids
+        self._next = 0
+        self._results = {}
+
+    def finish(self, user_id, delivered):
+        self._results[user_id] = delivered
+        while self._next < len(self._page) and self._page[self._next] in self._results:
+            user_id = self._page[self._next]
+            if self._results.pop(user_id):
+                self.sent += 1
+            else:
+                self.failed += 1
+            self.last_user_id = user_id
+            self._next += 1
+
+
+class BroadcastEngine:
+    """محرك الرسائل الجماعية: مرسلون متوازيون بحد للمعدل وتقدم محفوظ في broadcast_jobs
+
+    المستخدمون مرتبون حسب user_id، ويُحفظ التقدم (BroadcastProgress) كل
+    progress_interval ثانية أثناء الدفعة وعند نهايتها وعند الإيقاف، لذلك عند
+    إعادة التشغيل تُستأنف المهمة بعد آخر مستخدم انتهى إرساله وما قبله.
+    """
+
+    def __init__(self, adb, concurrency=BROADCAST_CONCURRENCY, batch_size=BROADCAST_BATCH_SIZE,
+                 max_retries=BROADCAST_MAX_RETRIES, limiter=None, progress_interval=BROADCAST_PROGRESS_INTERVAL):
+        self.adb = adb
+        self.bot = None
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.limiter = limiter or RateLimiter()
+        self._tasks = {}
+
+    async def start(self, bot):
+        """ربط المحرك بالبوت واستئناف المهام غير المكتملة"""
+        self.bot = bot
+        for job in await self.adb.get_running_broadcast_jobs():
+            logger.info(f"🔁 استئناف الرسالة الجماعية #{job['id']} بعد المستخدم {job['last_user_id']}")
+            self._spawn(job)
+
+    async def stop(self):
+        """إيقاف المهام الجارية - كل مهمة تحفظ تقدمها قبل أن تنتهي وستُستأنف عند التشغيل التالي"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, message, created_by=None):
+        """إنشاء مهمة جديدة وبدء إرسالها في الخلفية"""
+        job_id = await self.adb.create_broadcast_job(message, created_by)
+        if job_id is None:
+            return None
+        self._spawn({'id': job_id, 'message': message, 'last_user_id': 0,
+                     'sent': 0, 'failed': 0, 'created_by': created_by})
+        return job_id
+
+    def is_running(self, job_id):
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def _spawn(self, job):
+        task = asyncio.create_task(self._run_job(job))
+        self._tasks[job['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job['id'], None))
+
+    async def _run_job(self, job):
+        job_id = job['id']
+        text = BROADCAST_TEMPLATE.format(message=job['message'])
+        progress = BroadcastProgress(job['last_user_id'], job['sent'], job['failed'])
+        slots = asyncio.Semaphore(self.concurrency)
+        save_lock = asyncio.Lock()
+        saved_at = time.monotonic()
+
+        async def save(status='running'):
+            nonlocal saved_at
+            async with save_lock:
+                saved_at = time.monotonic()
+                await self.adb.save_broadcast_progress(
+                    job_id, progress.last_user_id, progress.sent, progress.failed, status=status
+                )
+
+        async def send(chat_id):
+            async with slots:
+                delivered = await self._send(chat_id, text)
+            progress.finish(chat_id, delivered)
+            if time.monotonic() - saved_at >= self.progress_interval and not save_lock.locked():
+                await save()
+
+        try:
+            while True:
+                page = await self.adb.get_users_after(progress.last_user_id, self.batch_size)
+                if not page:
+                    break
+                user_ids = [user['user_id'] for user in page]
+                progress.begin_page(user_ids)
+                await asyncio.gather(*(send(chat_id) for chat_id in user_ids))
+                await save()
+
+            await save(status='done')
+            logger.info(f"✅ انتهت الرسالة الجماعية #{job_id}: نجح {progress.sent}، فشل {progress.failed}")
+            if job.get('created_by'):
+                await self._send(job['created_by'], (
+                    f"✅ تم إرسال الرسالة #{job_id}\n\n"
+                    f"نجح: {progress.sent}\n"
+                    f"فشل: {progress.failed}"
+                ))
+        except asyncio.CancelledError:
+            # الإرسال الجاري أُلغي: يُحفظ ما انتهى فعلاً قبل أن يعود stop()
+            await save()
+            logger.info(f"⏸️ توقفت الرسالة الجماعية #{job_id} عند المستخدم {progress.last_user_id}")
+            raise
+        except Exception as e:
+            logger.error(f"خطأ في الرسالة الجماعية #{job_id}: {e}")
+
+    async def _send(self, chat_id, text):
+        """إرسال رسالة واحدة مع احترام الحدود وإعادة المحاولة - يعيد True عند النجاح"""
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                return True
+            except RetryAfter as e:
+                # تجاوز الحد: إيقاف كل المرسلين للمدة المطلوبة ثم إعادة المحاولة
+                self.limiter.pause(e.retry_after)
+            except (Forbidden, BadRequest) as e:
+                # المستخدم حظر البوت أو المحادثة غير موجودة - لا فائدة من إعادة المحاولة
+                logger.debug(f"فشل الإرسال إلى {chat_id}: {e}")
+                return False
+            except (TimedOut, NetworkError) as e:
+                logger.warning(f"خطأ شبكة أثناء الإرسال إلى {chat_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+        logger.error(f"فشل الإرسال إلى {chat_id} بعد {self.max_retries + 1} محاولات")
+        return False
@@ -0,0 +1,90 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ذاكرة مؤقتة محدودة الحجم مع إخراج LRU ومدة صلاحية (TTL) لكل عنصر"""
+
+    def __init__(self, maxsize=10000, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # يزيد مع كل إبطال حتى لا تُخزَّن قراءة بدأت قبل كتابة أحدث منها
+        self._invalidations = 0
+        # قيمة العداد عند آخر إبطال لكل مفتاح (الأحدث في النهاية، بحد maxsize) - إبطال
+        # لاعب لا يُلغي قراءات اللاعبين الآخرين الجارية
+        self._invalidated = OrderedDict()
+        # أكبر قيمة عداد حُذف سجلها: القراءات التي بدأت قبلها تُعتبر قديمة احتياطاً
+        self._forgotten = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """إرجاع القيمة أو None عند عدم وجودها أو انتهاء صلاحيتها"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def begin_load(self):
+        """رمز يُؤخذ قبل القراءة من قاعدة البيانات ويُمرَّر إلى put"""
+        return self._invalidations
+
+    def put(self, key, value, token=None):
+        """تخزين قيمة - تُهمل إذا أُبطل نفس المفتاح (أو مُسحت الذاكرة) بعد أخذ token"""
+        with self._lock:
+            if token is not None and (token < self._forgotten or self._invalidated.get(key, 0) > token):
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._invalidations += 1
+            self._invalidated[key] = self._invalidations
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.maxsize:
+                _, forgotten = self._invalidated.popitem(last=False)
+                self._forgotten = max(self._forgotten, forgotten)
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._invalidated.clear()
+            self._forgotten = self._invalidations
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """عدادات الإصابة والإخفاق والإخراج لتحديد الحجم المناسب"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import uuid
+import select
+import logging
+import threading
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+from storage import CHANGE_COLUMNS
+from metrics import CHANGE_FEED_LAG_SECONDS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# مطلوب عند تشغيل أكثر من نسخة من bot.py (webhook) - يضيف رحلة NOTIFY لكل كتابة، فهو معطل افتراضياً
+CHANGE_FEED_ENABLED = bool(int(os.getenv("CHANGE_FEED_ENABLED", 0)))
+CHANGE_FEED_CHANNEL = os.getenv("CHANGE_FEED_CHANNEL", "user_changes")
+CHANGE_FEED_RECONNECT_SECONDS = float(os.getenv("CHANGE_FEED_RECONNECT_SECONDS", 5))
+
+# حد حمولة NOTIFY في Postgres أقل من 8000 بايت - الدفعات الكبيرة تُقسم على عدة إشعارات
+MAX_PAYLOAD_BYTES = 7900
+
+# ترتيب القيم في كل صف من الإشعار (نفس أعمدة مستمعي التغييرات المحليين)
+FEED_COLUMNS = tuple(column.strip() for column in CHANGE_COLUMNS.split(','))
+
+# معرّف هذه العملية: كل نسخة تتجاهل إشعاراتها لأنها طبّقتها محلياً قبل الإرسال
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+
+def encode_changes(rows, instance_id=INSTANCE_ID, max_bytes=MAX_PAYLOAD_BYTES):
+    """الصفوف المتغيرة -> حمولات JSON مضغوطة: {"i": النسخة، "t": الوقت بالـ ms، "c": [[القيم]...]}
+
+    القيم بترتيب FEED_COLUMNS والغائبة من الصف null، وكل حمولة أقل من max_bytes.
+    """
+    header = f'{{"i":"{instance_id}","t":{int(time.time() * 1000)},"c":['
+    payloads, chunk, size = [], [], len(header) + 2
+    for row in rows:
+        encoded = json.dumps([row.get(column) for column in FEED_COLUMNS],
+                             separators=(',', ':'), ensure_ascii=False, default=str)
+        encoded_size = len(encoded.encode()) + 1
+        if chunk and size + encoded_size > max_bytes:
+            payloads.append(header + ','.join(chunk) + ']}')
+            chunk, size = [], len(header) + 2
+        chunk.append(encoded)
+        size += encoded_size
+    if chunk:
+        payloads.append(header + ','.join(chunk) + ']}')
+    return payloads
+
+
+def encode_event(event, instance_id=INSTANCE_ID):
+    """حدث بدون صفوف (مثل rollup بعد تحديث جداول التجميع)"""
+    return json.dumps({'i': instance_id, 't': int(time.time() * 1000), 'e': event}, separators=(',', ':'))
+
+
+def notify(cursor, payloads, channel=CHANGE_FEED_CHANNEL):
+    """إرسال الإشعارات داخل معاملة الكتابة نفسها: تصل للمستمعين فقط بعد الـ commit"""
+    if payloads:
+        cursor.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                       (channel, payloads))
+
+
+class ChangeFeed:
+    """استقبال تغييرات النسخ الأخرى عبر LISTEN وتطبيقها على الذاكرة المحلية (Postgres فقط)
+
+    اتصال مخصص خارج الـ pool في وضع autocommit وخيط ينتظر الإشعارات بـ select. كل
+    صف يُمرر لنفس نوع المستمعين المحليين callback(user_id, row) - افتراضياً إبطال
+    ذاكرة المستخدمين، ويضيف bot فهرس المتصدرين. الأحداث بدون صفوف (rollup) تُمرر
+    لمستمعي الأحداث. عند انقطاع الاتصال تضيع الإشعارات، فبعد إعادة الاتصال يُطلق
+    حدث resync ليعيد كل مستمع بناء حالته من القاعدة.
+    """
+
+    def __init__(self, database, channel=CHANGE_FEED_CHANNEL, reconnect_seconds=CHANGE_FEED_RECONNECT_SECONDS,
+                 instance_id=INSTANCE_ID):
+        self.database = database
+        self.channel = channel
+        self.reconnect_seconds = reconnect_seconds
+        self.instance_id = instance_id
+        self._listeners = [lambda user_id, row: database.user_cache.invalidate(user_id)]
+        self._event_listeners = {'resync': [database.user_cache.clear]}
+        self._conn = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # إحصائيات للمراقبة
+        self.received = 0
+        self.skipped_own = 0
+        self.applied_rows = 0
+        self.errors = 0
+        self.reconnects = 0
+
+    def add_listener(self, callback):
+        """تسجيل دالة تُستدعى لكل صف متغير من نسخة أخرى: callback(user_id, row)"""
+        self._listeners.append(callback)
+
+    def add_event_listener(self, event, callback):
+        """تسجيل دالة بدون معاملات لحدث ('rollup' أو 'resync')"""
+        self._event_listeners.setdefault(event, []).append(callback)
+
+    def listen(self):
+        """فتح اتصال الاستماع - يُستدعى قبل تحميل الحالة المحلية حتى لا يضيع تغيير بينهما
+
+        الإشعارات التي تصل قبل start() تنتظر في الاتصال وتُطبّق بعده.
+        """
+        if self._conn is None:
+            conn = psycopg2.connect(self.database.database_url, connect_timeout=5)
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+            self._conn = conn
+            logger.info(f"📡 الاستماع لتغييرات النسخ الأخرى على {self.channel} (النسخة {self.instance_id})")
+
+    def start(self):
+        """تشغيل خيط الاستقبال"""
+        if self._thread is None:
+            self.listen()
+            self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._disconnect()
+
+    def _disconnect(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self._conn is None:
+                    self.listen()
+                    self.reconnects += 1
+                    self._emit('resync')
+                # مهلة قصيرة حتى يُلاحظ stop() بسرعة
+                if select.select([self._conn], [], [], 1.0)[0]:
+                    self._conn.poll()
+                while self._conn.notifies:
+                    self._handle(self._conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"❌ انقطع اتصال تغييرات النسخ الأخرى: {e}")
+                self._disconnect()
+                self._stopping.wait(self.reconnect_seconds)
+
+    def _handle(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            self.errors += 1
+            logger.error(f"إشعار تغيير غير صالح: {payload[:100]}")
+            return
+        if message.get('i') == self.instance_id:
+            self.skipped_own += 1
+            return
+        self.received += 1
+        if 't' in message:
+            CHANGE_FEED_LAG_SECONDS.observe(max(time.time() - message['t'] / 1000, 0))
+
+        for values in message.get('c', ()):
+            row = {column: value for column, value in zip(FEED_COLUMNS, values) if value is not None}
+            for callback in self._listeners:
+                try:
+                    callback(row['user_id'], row)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"خطأ في مستمع تغييرات النسخ الأخرى: {e}")
+            self.applied_rows += 1
+        if 'e' in message:
+            self._emit(message['e'])
+
+    def _emit(self, event):
+        for callback in self._event_listeners.get(event, ()):
+            try:
+                callback()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"خطأ في معالجة حدث {event}: {e}")
+
+    def stats(self):
+        return {
+            'instance_id': self.instance_id,
+            'connected': self._conn is not None,
+            'received': self.received,
+            'skipped_own': self.skipped_own,
+            'applied_rows': self.applied_rows,
+            'errors': self.errors,
+            'reconnects': self.reconnects,
+        }
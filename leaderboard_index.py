@@ -0,0 +1,237 @@
+import random
+import logging
+import threading
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+# ترتيب الحقول في الصفوف كما يعيدها Database.get_ranking_rows
+LEADERBOARD_FIELDS = ('user_id', 'username', 'first_name', 'balance', 'level', 'total_taps')
+
+_MAX_LEVEL = 16          # يكفي لأكثر من 4 مليار عنصر مع p = 1/4
+_P = 0.25
+_END = (float('inf'),)   # مفتاح أكبر من أي مفتاح حقيقي
+
+
+class _Node:
+    __slots__ = ('key', 'row', 'next', 'width')
+
+    def __init__(self, key, row, height):
+        self.key = key
+        self.row = row
+        self.next = [None] * height
+        # width[level] = عدد المواقع حتى العقدة التالية في هذا المستوى
+        self.width = [0] * height
+
+
+def _random_height():
+    height = 1
+    while height < _MAX_LEVEL and random.random() < _P:
+        height += 1
+    return height
+
+
+class RankedSkipList:
+    """Skip list مفهرسة: إدراج وحذف وحساب الترتيب والوصول بالموقع في O(log n)"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._tail = _Node(_END, None, 0)
+        self._head = _Node(None, None, _MAX_LEVEL)
+        self._head.next = [self._tail] * _MAX_LEVEL
+        self._head.width = [1] * _MAX_LEVEL
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def build(self, items):
+        """بناء القائمة في O(n) من أزواج (key, row) مرتبة تصاعدياً"""
+        self.clear()
+        last = [self._head] * _MAX_LEVEL
+        last_pos = [0] * _MAX_LEVEL
+        nodes = []
+        append = nodes.append
+        height_of = _random_height
+        pos = 0
+        for pos, (key, row) in enumerate(items, 1):
+            height = height_of()
+            node = _Node(key, row, height)
+            for level in range(height):
+                last[level].next[level] = node
+                last[level].width[level] = pos - last_pos[level]
+                last[level] = node
+                last_pos[level] = pos
+            append(node)
+        for level in range(_MAX_LEVEL):
+            last[level].next[level] = self._tail
+            last[level].width[level] = pos + 1 - last_pos[level]
+        self._size = pos
+        return nodes
+
+    def insert(self, key, row):
+        update = [None] * _MAX_LEVEL
+        steps = [0] * _MAX_LEVEL
+        node = self._head
+        pos = 0
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level].key < key:
+                pos += node.width[level]
+                node = node.next[level]
+            update[level] = node
+            steps[level] = pos
+
+        new_node = _Node(key, row, _random_height())
+        new_pos = pos + 1
+        for level in range(len(new_node.next)):
+            prev = update[level]
+            new_node.next[level] = prev.next[level]
+            new_node.width[level] = steps[level] + prev.width[level] + 1 - new_pos
+            prev.next[level] = new_node
+            prev.width[level] = new_pos - steps[level]
+        for level in range(len(new_node.next), _MAX_LEVEL):
+            update[level].width[level] += 1
+        self._size += 1
+        return new_node
+
+    def remove(self, key):
+        update = [None] * _MAX_LEVEL
+        node = self._head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            update[level] = node
+
+        target = update[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+        for level in range(_MAX_LEVEL):
+            prev = update[level]
+            if prev.next[level] is target:
+                prev.width[level] += target.width[level] - 1
+                prev.next[level] = target.next[level]
+            else:
+                prev.width[level] -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        """الترتيب (يبدأ من 1) للمفتاح، أو None إذا لم يكن موجوداً"""
+        node = self._head
+        pos = 0
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level].key < key:
+                pos += node.width[level]
+                node = node.next[level]
+        if node.next[0].key != key:
+            return None
+        return pos + 1
+
+    def node_at(self, index):
+        """العقدة في الموقع index (يبدأ من 1)"""
+        if index < 1 or index > self._size:
+            raise IndexError(index)
+        node = self._head
+        pos = 0
+        for level in reversed(range(_MAX_LEVEL)):
+            while pos + node.width[level] <= index:
+                pos += node.width[level]
+                node = node.next[level]
+        return node
+
+    def iter_from(self, index, count):
+        """إرجاع صفوف count عنصراً ابتداءً من الموقع index"""
+        if count <= 0 or index > self._size:
+            return []
+        node = self.node_at(max(index, 1))
+        rows = []
+        while node is not self._tail and len(rows) < count:
+            rows.append(node.row)
+            node = node.next[0]
+        return rows
+
+
+class LeaderboardIndex:
+    """فهرس المتصدرين في الذاكرة: أفضل N وترتيب اللاعب ومن حوله بدون Postgres"""
+
+    def __init__(self):
+        self._ranking = RankedSkipList()
+        self._nodes = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    @staticmethod
+    def _key(user_id, balance):
+        # الرصيد الأعلى أولاً، ثم user_id لترتيب ثابت عند التساوي
+        return (-(balance or 0), user_id)
+
+    @staticmethod
+    def _to_dict(row, rank):
+        entry = dict(zip(LEADERBOARD_FIELDS, row))
+        entry['rank'] = rank
+        return entry
+
+    def __len__(self):
+        return len(self._ranking)
+
+    def load(self, rows):
+        """تحميل كل اللاعبين مرة واحدة (صفوف بترتيب LEADERBOARD_FIELDS)"""
+        # فرز مستقر على مرحلتين بمفاتيح رقمية (أسرع بكثير من مقارنة tuples)
+        rows = [tuple(row) for row in rows]
+        rows.sort(key=itemgetter(0))
+        rows.sort(key=lambda row: row[3] or 0, reverse=True)
+        items = ((self._key(row[0], row[3]), row) for row in rows)
+        with self._lock:
+            nodes = self._ranking.build(items)
+            self._nodes = {node.row[0]: node for node in nodes}
+            self.loaded = True
+        logger.info(f"🏆 تم تحميل فهرس المتصدرين: {len(rows)} لاعب")
+
+    def apply_change(self, user_id, changes):
+        """تحديث لاعب واحد بعد تغيير في قاعدة البيانات (يُستخدم كـ change listener)"""
+        with self._lock:
+            node = self._nodes.get(user_id)
+            if node is not None:
+                current = dict(zip(LEADERBOARD_FIELDS, node.row))
+            else:
+                current = dict.fromkeys(LEADERBOARD_FIELDS)
+                current['user_id'] = user_id
+            current.update((field, changes[field]) for field in LEADERBOARD_FIELDS[1:] if field in changes)
+            row = tuple(current[field] for field in LEADERBOARD_FIELDS)
+
+            key = self._key(user_id, current['balance'])
+            if node is not None and node.key == key:
+                node.row = row
+                return
+            if node is not None:
+                self._ranking.remove(node.key)
+            self._nodes[user_id] = self._ranking.insert(key, row)
+
+    def remove(self, user_id):
+        with self._lock:
+            node = self._nodes.pop(user_id, None)
+            if node is not None:
+                self._ranking.remove(node.key)
+
+    def top(self, limit=10):
+        with self._lock:
+            rows = self._ranking.iter_from(1, limit)
+        return [self._to_dict(row, rank) for rank, row in enumerate(rows, 1)]
+
+    def rank(self, user_id):
+        """ترتيب اللاعب (يبدأ من 1) أو None"""
+        with self._lock:
+            node = self._nodes.get(user_id)
+            return self._ranking.rank(node.key) if node is not None else None
+
+    def around(self, user_id, radius=5):
+        """اللاعبون حول اللاعب: radius قبله و radius بعده"""
+        with self._lock:
+            node = self._nodes.get(user_id)
+            if node is None:
+                return []
+            rank = self._ranking.rank(node.key)
+            first = max(rank - radius, 1)
+            rows = self._ranking.iter_from(first, rank - first + radius + 1)
+        return [self._to_dict(row, position) for position, row in enumerate(rows, first)]
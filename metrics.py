@@ -0,0 +1,201 @@
+import time
+import asyncio
+import threading
+import functools
+from bisect import bisect_left
+
+# حدود الـ buckets بالثواني (نفس افتراضيات عملاء Prometheus)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """عداد تراكمي لكل مجموعة labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values = {}
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in values]
+
+
+class Gauge(_Metric):
+    """قيمة لحظية - تُضبط يدوياً أو تُقرأ من func عند الجمع فقط"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, func=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values = {}
+        self._func = func
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+    def _samples(self):
+        if self._func is not None:
+            return [f'{self.name} {_format_value(self._func())}']
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in values]
+
+
+class Histogram(_Metric):
+    """توزيع القيم على buckets ثابتة - التسجيل عداد واحد ومجموع، والتجميع التراكمي عند الجمع"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self):
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = []
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """كل المقاييس بصيغة Prometheus النصية - تُحسب فقط عند الطلب"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def timed(histogram, label=None):
+    """ديكوريتر لقياس زمن دالة (متزامنة أو async) في histogram بـ label اسم الدالة"""
+    def decorator(func):
+        labels = (label or func.__name__,)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, labels)
+        return wrapper
+
+    return decorator
+
+
+# مقاييس التطبيق
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'زمن طلبات HTTP لكل مسار', ('route', 'method', 'status'))
+DB_QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'زمن عمليات قاعدة البيانات لكل دالة', ('method',))
+DB_POOL_WAIT_SECONDS = Histogram(
+    'db_pool_wait_seconds', 'زمن انتظار الحصول على اتصال من الـ pool',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+DB_POOL_IN_USE = Gauge(
+    'db_pool_connections_in_use', 'عدد الاتصالات المستخدمة حالياً')
+HANDLER_SECONDS = Histogram(
+    'telegram_handler_duration_seconds', 'زمن معالجة أوامر تيليجرام', ('command',))
+HTTP_THROTTLED = Counter(
+    'http_throttled_requests_total', 'الطلبات المرفوضة بحدود الطلبات (rate: حد اللاعب، concurrency: حد القاعدة)',
+    ('route', 'reason'))
+HTTP_DB_IN_FLIGHT = Gauge(
+    'http_db_requests_in_flight', 'طلبات HTTP الجارية التي تصل لقاعدة البيانات')
+STARTUP_SECONDS = Gauge(
+    'startup_duration_seconds', 'زمن بدء التشغيل لكل مرحلة (database: الاتصال والترحيل، total: حتى الجاهزية)',
+    ('phase',))
+CHANGE_FEED_LAG_SECONDS = Histogram(
+    'change_feed_lag_seconds', 'الزمن بين إرسال إشعار التغيير من نسخة أخرى وتطبيقه محلياً')
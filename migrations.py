@@ -0,0 +1,248 @@
+"""ترحيلات مخطط قاعدة البيانات بالترتيب - لكل ترحيل رقم إصدار ونص لكل نوع تخزين
+
+كل ترحيل يُطبق مرة واحدة فقط ويُسجل في جدول schema_version، فإذا كان المخطط
+محدّثاً لا يُنفذ أي DDL عند بدء التشغيل (استعلام قراءة واحد فقط).
+
+لتغيير المخطط: أضف Migration جديداً في آخر القائمة برقم أكبر - لا تعدّل
+ترحيلاً طُبق من قبل.
+"""
+from collections import namedtuple
+
+Migration = namedtuple('Migration', 'version name postgres sqlite')
+
+# الأوقات في SQLite تُخزن كنص UTC بدقة الملي ثانية - الترتيب والمقارنة كنص صحيحان
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+SCHEMA_VERSION_TABLE = {
+    'postgres': """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'sqlite': f"""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT ({SQLITE_NOW})
+        )
+    """,
+}
+
+# ترحيلات Postgres الأولى بـ IF NOT EXISTS حتى تُسجل على القواعد الموجودة قبل schema_version بلا أخطاء
+MIGRATIONS = [
+    Migration(1, "الجداول الأساسية", postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            balance BIGINT DEFAULT 0,
+            taps_today INTEGER DEFAULT 0,
+            energy INTEGER DEFAULT 1000,
+            level INTEGER DEFAULT 1,
+            tap_power INTEGER DEFAULT 1,
+            total_taps BIGINT DEFAULT 0,
+            invited_by BIGINT,
+            invited_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at DESC)",
+        """
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            date DATE DEFAULT CURRENT_DATE,
+            taps INTEGER DEFAULT 0,
+            coins_earned INTEGER DEFAULT 0,
+            UNIQUE(user_id, date)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_daily_stats_user_date ON daily_stats(user_id, date)",
+        """
+        CREATE TABLE IF NOT EXISTS referrals (
+            id SERIAL PRIMARY KEY,
+            referrer_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            referred_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            reward_given BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(referred_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_tasks (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            task_type VARCHAR(50),
+            completed BOOLEAN DEFAULT FALSE,
+            completed_at TIMESTAMP,
+            reward INTEGER DEFAULT 0,
+            UNIQUE(user_id, task_type)
+        )
+        """,
+    ], sqlite=[
+        # SQLite بدأ بكل أعمدة users (last_seq و energy_updated_at) فلا حاجة للترحيلين 2 و 3
+        f"""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            balance INTEGER DEFAULT 0,
+            taps_today INTEGER DEFAULT 0,
+            energy INTEGER DEFAULT 1000,
+            level INTEGER DEFAULT 1,
+            tap_power INTEGER DEFAULT 1,
+            total_taps INTEGER DEFAULT 0,
+            invited_by INTEGER,
+            invited_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT ({SQLITE_NOW}),
+            last_active TIMESTAMP DEFAULT ({SQLITE_NOW}),
+            last_seq INTEGER DEFAULT 0,
+            energy_updated_at TIMESTAMP DEFAULT ({SQLITE_NOW})
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at DESC)",
+        """
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+            date DATE DEFAULT (date('now')),
+            taps INTEGER DEFAULT 0,
+            coins_earned INTEGER DEFAULT 0,
+            UNIQUE(user_id, date)
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS referrals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+            referred_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+            reward_given BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT ({SQLITE_NOW}),
+            UNIQUE(referred_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+            task_type TEXT,
+            completed BOOLEAN DEFAULT 0,
+            completed_at TIMESTAMP,
+            reward INTEGER DEFAULT 0,
+            UNIQUE(user_id, task_type)
+        )
+        """,
+    ]),
+    # آخر رقم تسلسلي لدفعات النقرات (لتجاهل الطلبات المكررة أو المتأخرة)
+    Migration(2, "users.last_seq", postgres=[
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seq BIGINT DEFAULT 0",
+    ], sqlite=[]),
+    # وقت آخر تغيير للطاقة المخزنة - التجدد يُحسب منه عند القراءة
+    Migration(3, "users.energy_updated_at", postgres=[
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS energy_updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP",
+    ], sqlite=[]),
+    # جدول مهام الرسائل الجماعية (لاستئناف الإرسال بعد إعادة التشغيل)
+    Migration(4, "broadcast_jobs", postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id SERIAL PRIMARY KEY,
+            message TEXT NOT NULL,
+            status VARCHAR(20) DEFAULT 'running',
+            last_user_id BIGINT DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_by BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+    ], sqlite=[
+        f"""
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT NOT NULL,
+            status TEXT DEFAULT 'running',
+            last_user_id INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT ({SQLITE_NOW}),
+            finished_at TIMESTAMP
+        )
+        """,
+    ]),
+    # عدّ دعوات اللاعب (/api/bootstrap) بدون مسح جدول الدعوات كاملاً
+    Migration(5, "idx_referrals_referrer", postgres=[
+        "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)",
+    ], sqlite=[
+        "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)",
+    ]),
+    # محرك المهام: يوم النقرات (لتصفير taps_today يومياً)، أيام اللعب المتتالية، وفترة المهمة
+    # (اليوم للمهام اليومية، NULL للمهام التي تُنجز مرة واحدة)
+    Migration(6, "tasks", postgres=[
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS taps_day DATE",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS streak_days INTEGER DEFAULT 0",
+        "ALTER TABLE user_tasks ADD COLUMN IF NOT EXISTS period DATE",
+    ], sqlite=[
+        "ALTER TABLE users ADD COLUMN taps_day DATE",
+        "ALTER TABLE users ADD COLUMN streak_days INTEGER DEFAULT 0",
+        "ALTER TABLE user_tasks ADD COLUMN period DATE",
+    ]),
+    # متصدرو اليوم والأسبوع: تجميع أسبوعي يُحدّث مع daily_stats في نفس التفريغ، وفهارس
+    # (الفترة، العملات) حتى تكون قراءة الأوائل مسحاً قصيراً لفهرس الفترة. الملء الأولي مرة واحدة.
+    Migration(7, "period_rollups", postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS weekly_stats (
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            week DATE NOT NULL,
+            taps BIGINT DEFAULT 0,
+            coins_earned BIGINT DEFAULT 0,
+            PRIMARY KEY (user_id, week)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_daily_stats_date_coins ON daily_stats(date, coins_earned DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_weekly_stats_week_coins ON weekly_stats(week, coins_earned DESC)",
+        """
+        INSERT INTO weekly_stats (user_id, week, taps, coins_earned)
+        SELECT user_id, date_trunc('week', date)::date, SUM(taps), SUM(coins_earned)
+        FROM daily_stats
+        GROUP BY 1, 2
+        ON CONFLICT DO NOTHING
+        """,
+    ], sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS weekly_stats (
+            user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+            week DATE NOT NULL,
+            taps INTEGER DEFAULT 0,
+            coins_earned INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, week)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_daily_stats_date_coins ON daily_stats(date, coins_earned DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_weekly_stats_week_coins ON weekly_stats(week, coins_earned DESC)",
+        """
+        INSERT INTO weekly_stats (user_id, week, taps, coins_earned)
+        SELECT user_id, date(date, 'weekday 0', '-6 days'), SUM(taps), SUM(coins_earned)
+        FROM daily_stats
+        GROUP BY 1, 2
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+]
+
+# إصدار المخطط الذي يتوقعه هذا الكود
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+def pending_migrations(current_version, dialect):
+    """الترحيلات التي لم تُطبق بعد بالترتيب: [(version, name, statements)]"""
+    return [(migration.version, migration.name, getattr(migration, dialect))
+            for migration in MIGRATIONS if migration.version > current_version]
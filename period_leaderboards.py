@@ -0,0 +1,86 @@
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+from storage import PERIOD_TABLES, utc_today, week_start
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PERIOD_LEADERBOARD_SIZE = int(os.getenv("PERIOD_LEADERBOARD_SIZE", 100))  # عدد الصفوف المحفوظة لكل فترة
+
+PERIODS = tuple(PERIOD_TABLES)
+
+
+def period_start(period, day=None):
+    """بداية الفترة الحالية (UTC): اليوم نفسه أو يوم الإثنين من الأسبوع"""
+    day = day or utc_today()
+    return day if period == 'day' else week_start(day)
+
+
+class PeriodLeaderboards:
+    """متصدرو اليوم والأسبوع من جداول التجميع (daily_stats و weekly_stats)
+
+    الجداول تُحدّث تدريجياً مع كل تفريغ لـ DailyStatsBuffer، فالنتيجة لا تتغير
+    بين تفريغين: تُحفظ في الذاكرة مع رقم التفريغ (flush_count) وتُعاد كما هي حتى
+    التفريغ التالي أو بداية فترة جديدة، ثم يُعاد جلبها باستعلام واحد على الفهرس.
+    """
+
+    def __init__(self, database, rollup_buffer, size=PERIOD_LEADERBOARD_SIZE):
+        self.database = database
+        self.rollup_buffer = rollup_buffer
+        self.size = size
+        self._cache = {}  # period -> (بداية الفترة، رقم التفريغ، الصفوف)
+        self._lock = threading.Lock()
+
+        # إحصائيات للمراقبة
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, period, limit):
+        """النتيجة من الذاكرة إذا كانت ما تزال صالحة، وإلا None - بدون أي استعلام"""
+        entry = self._cache.get(period)
+        if entry is None or limit > self.size:
+            return None
+        start, generation, rows = entry
+        if start != period_start(period) or generation != self.rollup_buffer.flush_count:
+            return None
+        self.hits += 1
+        return rows[:limit]
+
+    def top(self, period, limit):
+        """أفضل limit لاعب في الفترة - يستعلم القاعدة فقط عند انتهاء صلاحية النسخة المحفوظة"""
+        rows = self.cached(period, limit)
+        if rows is not None:
+            return rows
+        with self._lock:
+            # طلب متزامن ربما جلبها أثناء الانتظار
+            rows = self.cached(period, limit)
+            if rows is not None:
+                return rows
+            self.misses += 1
+            # رقم التفريغ يُقرأ قبل الاستعلام: تفريغ أثناءه يجعل النسخة قديمة لا أحدث
+            generation = self.rollup_buffer.flush_count
+            start = period_start(period)
+            rows = self.database.get_period_leaderboard(period, start, limit=max(limit, self.size))
+            if rows is None:
+                return []
+            if limit <= self.size:
+                self._cache[period] = (start, generation, rows)
+            return rows[:limit]
+
+    def invalidate(self):
+        """إسقاط كل النسخ المحفوظة - عند تحديث التجميع من نسخة أخرى (change_feed)"""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'periods': len(self._cache),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,215 @@
+import os
+import time
+import logging
+import threading
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # أقصى انتظار لاتصال حر
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 3600))  # عمر الاتصال قبل استبداله
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))  # إغلاق الاتصالات الزائدة الخاملة
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", 30))  # SELECT 1 فقط لما خمل أطول من هذا
+
+
+class PoolTimeout(PoolError):
+    """لا يوجد اتصال حر خلال مهلة الانتظار"""
+
+
+class ConnectionPool:
+    """Connection pool آمن بين الخيوط: انتظار بمهلة، عمر أقصى، إغلاق الخامل، وفحص عند الإعارة
+
+    الاتصالات الخاملة تُحفظ كمكدس (LIFO) حتى يُعاد استخدام الأحدث، وتبقى
+    الأقدم خاملة لتُغلق عند تجاوز max_idle. الفحص عند الإعارة محلي (حالة
+    الاتصال) إلا إذا خمل الاتصال أكثر من check_idle فيُرسل SELECT 1.
+    """
+
+    def __init__(self, dsn, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 max_lifetime=DB_POOL_MAX_LIFETIME, max_idle=DB_POOL_MAX_IDLE,
+                 check_idle=DB_POOL_CHECK_IDLE, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+        self.connect_kwargs = connect_kwargs
+
+        self._idle = []  # [(conn, returned_at)]
+        self._created_at = {}  # conn -> وقت الإنشاء (لكل الاتصالات المفتوحة)
+        self._size = 0  # المفتوحة + قيد الفتح
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # إحصائيات للمراقبة
+        self.checkouts = 0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        for _ in range(minconn):
+            with self._cond:
+                self._size += 1
+            self._put_idle(self._connect())
+
+    def _connect(self):
+        try:
+            conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created_at[conn] = time.monotonic()
+            self.created += 1
+        return conn
+
+    def _close(self, conn):
+        """إغلاق اتصال وتحرير مكانه (يُستدعى بدون القفل)"""
+        with self._cond:
+            self._created_at.pop(conn, None)
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _put_idle(self, conn):
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _expired(self, conn, now):
+        created_at = self._created_at.get(conn)
+        return created_at is None or now - created_at > self.max_lifetime
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed or conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if idle_for < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _prune_idle(self, now):
+        """إخراج الاتصالات الخاملة طويلاً (فوق minconn) - يُستدعى مع القفل"""
+        stale = []
+        while self._idle and self._size - len(stale) > self.minconn:
+            conn, returned_at = self._idle[0]
+            if now - returned_at <= self.max_idle:
+                break
+            self._idle.pop(0)
+            stale.append(conn)
+        return stale
+
+    def getconn(self, timeout=None):
+        """استعارة اتصال - تنتظر حتى timeout ثانية ثم ترفع PoolTimeout"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    now = time.monotonic()
+                    stale = self._prune_idle(now)
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"لا يوجد اتصال حر خلال {timeout} ثانية ({self.maxconn} مستخدمة)")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+            for old in stale:
+                self._close(old)
+
+            if create:
+                conn = self._connect()
+            else:
+                now = time.monotonic()
+                if self._expired(conn, now) or not self._healthy(conn, now - returned_at):
+                    self._close(conn)
+                    continue
+
+            with self._cond:
+                self._in_use += 1
+                self.checkouts += 1
+                waited = time.monotonic() - started
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """إرجاع الاتصال - discard=True لإغلاقه (مثلاً بعد خطأ اتصال)"""
+        with self._cond:
+            self._in_use -= 1
+            closed = self._closed
+        if not discard and not closed and not conn.closed and not self._expired(conn, time.monotonic()):
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                self._put_idle(conn)
+                return
+            except psycopg2.Error as e:
+                logger.warning(f"إغلاق اتصال معطوب: {e}")
+        self._close(conn)
+
+    def closeall(self):
+        """إغلاق كل الاتصالات الخاملة ومنع الاستعارة - المستعارة تُغلق عند إرجاعها"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """إحصائيات الاستخدام"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'maxconn': self.maxconn,
+                'utilization': self._in_use / self.maxconn if self.maxconn else 0.0,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'created': self.created,
+                'discarded': self.discarded,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+            }
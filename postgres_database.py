@@ -0,0 +1,746 @@
+import time
+import logging
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+from contextlib import contextmanager
+from pool import ConnectionPool
+from storage import (
+    BaseDatabase, MAX_ENERGY, ENERGY_REGEN_PER_SECOND, REFERRAL_REWARD, MAX_REWARDED_INVITES,
+    CHANGE_COLUMNS, USER_COLUMNS, BOOTSTRAP_COLUMNS, DEFAULT_USER_LIST_COLUMNS, STREAM_ITERSIZE,
+    PERIOD_TABLES, _select_columns, merge_registrations, utc_today, weekly_rollup
+)
+from migrations import SCHEMA_VERSION, SCHEMA_VERSION_TABLE, pending_migrations
+from change_feed import CHANGE_FEED_ENABLED, encode_changes, encode_event, notify
+from metrics import timed, DB_QUERY_SECONDS, DB_POOL_WAIT_SECONDS, DB_POOL_IN_USE
+
+logger = logging.getLogger(__name__)
+
+# رقم قفل advisory ثابت لترحيل المخطط - نسخة واحدة فقط تطبق الترحيلات في نفس الوقت
+MIGRATION_LOCK_ID = 72_651_001
+
+# الاستعلامات الساخنة كـ prepared statements: الاسم -> (أنواع المعاملات، النص)
+# تُنشأ عند أول استخدام على كل اتصال ثم يُعاد استخدام خطتها
+PREPARED_STATEMENTS = {
+    # أعمدة صريحة وليس *: خطة محضّرة على * تفشل ("cached plan must not change result type")
+    # بعد أن تضيف نسخة أخرى عموداً بترحيل، وعلى كل اتصالات الـ pool
+    'get_user': ('bigint', f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE user_id = $1"),
+    # كل ما تحتاجه واجهة الويب عند الفتح في رحلة واحدة - الترتيب يُحسب فقط عند طلبه ($2)
+    'get_bootstrap': ('bigint, boolean, date', f"""
+        SELECT {', '.join('u.' + column for column in BOOTSTRAP_COLUMNS)}, u.energy_updated_at, u.taps_day,
+               (SELECT COUNT(*) FROM referrals AS r WHERE r.referrer_id = u.user_id) AS referrals,
+               -- المهام اليومية ($3 = اليوم) منجزة فقط إذا كان إنجازها في نفس اليوم
+               (SELECT json_object_agg(t.task_type, t.completed AND (t.period IS NULL OR t.period >= $3))
+                FROM user_tasks AS t WHERE t.user_id = u.user_id) AS tasks,
+               CASE WHEN $2 THEN
+                   (SELECT COUNT(*) FROM users AS o WHERE o.balance > u.balance)
+                   + (SELECT COUNT(*) FROM users AS o WHERE o.balance = u.balance AND o.user_id < u.user_id)
+                   + 1
+               END AS rank
+        FROM users AS u
+        WHERE u.user_id = $1
+    """),
+    'get_leaderboard': ('int', """
+        SELECT user_id, username, first_name, balance, level, total_taps
+        FROM users
+        ORDER BY balance DESC
+        LIMIT $1
+    """),
+    # شكل ثابت واحد بدل بناء الاستعلام من الحقول غير الفارغة - NULL يعني "بدون تغيير"
+    'update_game_data': ('bigint, bigint, int, int, int, int', f"""
+        UPDATE users SET
+            balance = COALESCE($2, balance),
+            taps_today = COALESCE($3, taps_today),
+            energy = COALESCE($4, energy),
+            energy_updated_at = CASE WHEN $4 IS NULL THEN energy_updated_at ELSE CURRENT_TIMESTAMP END,
+            level = COALESCE($5, level),
+            tap_power = COALESCE($6, tap_power),
+            last_active = CURRENT_TIMESTAMP
+        WHERE user_id = $1
+        RETURNING {CHANGE_COLUMNS}
+    """),
+    # $4 = اليوم (UTC): أول دفعة في يوم جديد تصفّر taps_today وتمدّد أو تعيد سلسلة الأيام
+    'apply_taps': ('bigint, int, bigint, date', f"""
+        WITH regen AS (
+            SELECT user_id, tap_power, energy, energy_updated_at,
+                   FLOOR(EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - energy_updated_at))
+                         * {ENERGY_REGEN_PER_SECOND})::int AS gained
+            FROM users
+            WHERE user_id = $1 AND last_seq < $3
+            FOR UPDATE
+        ),
+        accepted AS (
+            SELECT r.user_id, r.tap_power,
+                   LEAST(r.energy + GREATEST(r.gained, 0), {MAX_ENERGY}) AS energy_now,
+                   -- عند امتلاء الطاقة يبدأ التجدد من الآن، وإلا نحتفظ بكسور الثانية
+                   CASE WHEN r.energy + r.gained >= {MAX_ENERGY} THEN CURRENT_TIMESTAMP
+                        ELSE r.energy_updated_at
+                             + make_interval(secs => GREATEST(r.gained, 0)::float8 / {ENERGY_REGEN_PER_SECOND})
+                   END AS regen_from
+            FROM regen AS r
+        ),
+        spent AS (
+            SELECT user_id, tap_power, energy_now, regen_from,
+                   LEAST($2, energy_now / GREATEST(tap_power, 1)) AS n
+            FROM accepted
+        )
+        UPDATE users AS u SET
+            balance = u.balance + a.n * u.tap_power,
+            total_taps = u.total_taps + a.n,
+            taps_today = CASE WHEN u.taps_day = $4 THEN u.taps_today ELSE 0 END + a.n,
+            taps_day = $4,
+            streak_days = CASE WHEN u.taps_day = $4 THEN u.streak_days
+                               WHEN u.taps_day = $4 - 1 THEN u.streak_days + 1
+                               ELSE 1 END,
+            energy = a.energy_now - a.n * u.tap_power,
+            energy_updated_at = a.regen_from,
+            level = GREATEST(u.level, (u.balance + a.n * u.tap_power) / 100 + 1),
+            tap_power = GREATEST(u.tap_power, (u.balance + a.n * u.tap_power) / 100 + 1),
+            last_seq = $3,
+            last_active = CURRENT_TIMESTAMP
+        FROM spent AS a
+        WHERE u.user_id = a.user_id
+        RETURNING u.user_id, u.username, u.first_name, u.balance, u.taps_today,
+                  u.energy, u.level, u.tap_power, u.total_taps, u.streak_days, a.n AS accepted,
+                  a.n * a.tap_power AS earned
+    """),
+}
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """اتصال يتذكر أسماء الـ prepared statements المنشأة عليه (تعيش بعمر الجلسة)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class PostgresDatabase(BaseDatabase):
+    """التخزين في PostgreSQL عبر psycopg2 و connection pool"""
+
+    DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+    def __init__(self, database_url):
+        super().__init__()
+        self.database_url = database_url
+        # يُنشأ عند أول استخدام (ensure_ready) وليس عند الاستيراد
+        self.connection_pool = None
+        # إشعار النسخ الأخرى بكل تغيير عبر NOTIFY (انظر change_feed)
+        self.change_feed_enabled = CHANGE_FEED_ENABLED
+
+    def _open(self):
+        if self.connection_pool is None:
+            # connection pool آمن بين الخيوط - ينتظر اتصالاً حراً بدل رفع خطأ عند الامتلاء
+            self.connection_pool = ConnectionPool(
+                self.database_url, connect_timeout=5, connection_factory=PreparingConnection
+            )
+    
+    @staticmethod
+    def _execute_prepared(cursor, name, params):
+        """تنفيذ prepared statement مع إنشائه على الاتصال عند أول استخدام"""
+        prepared = cursor.connection.prepared
+        if name not in prepared:
+            types, query = PREPARED_STATEMENTS[name]
+            cursor.execute(f"PREPARE {name} ({types}) AS {query}")
+            prepared.add(name)
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    
+    def _notify_changes(self, cursor, rows):
+        """نشر الصفوف المتغيرة للنسخ الأخرى داخل معاملة الكتابة - تُرسل مع الـ commit فقط"""
+        if self.change_feed_enabled and rows:
+            notify(cursor, encode_changes(rows))
+
+    def _notify_event(self, cursor, event):
+        if self.change_feed_enabled:
+            notify(cursor, [encode_event(event)])
+
+    def get_connection(self):
+        """الحصول على اتصال من pool (مع تهيئة القاعدة عند أول استخدام)"""
+        self.ensure_ready()
+        return self._pooled_connection()
+
+    @contextmanager
+    def _pooled_connection(self):
+        conn = None
+        broken = False
+        try:
+            started = time.perf_counter()
+            conn = self.connection_pool.getconn()
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+            DB_POOL_IN_USE.inc()
+            yield conn
+            conn.commit()
+        except Exception as e:
+            # أخطاء الاتصال نفسه تعني أن الاتصال غير صالح ولا يعود إلى الـ pool
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if conn and not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            logger.error(f"خطأ في الاتصال: {e}")
+            raise
+        finally:
+            if conn:
+                self.connection_pool.putconn(conn, discard=broken)
+                DB_POOL_IN_USE.dec()
+    
+    @staticmethod
+    def _schema_version(cursor):
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return cursor.fetchone()[0]
+
+    def init_database(self):
+        """ترحيل المخطط إلى SCHEMA_VERSION - بدون أي DDL إذا كان محدّثاً"""
+        try:
+            with self._pooled_connection() as conn:
+                with conn.cursor() as cursor:
+                    version = self._schema_version(cursor)
+                    if version >= SCHEMA_VERSION:
+                        return version
+
+                    # قفل حتى نهاية المعاملة ثم إعادة القراءة: نسخة أخرى ربما رحّلت قبلنا
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                    version = self._schema_version(cursor)
+                    cursor.execute(SCHEMA_VERSION_TABLE['postgres'])
+                    for version, name, statements in pending_migrations(version, 'postgres'):
+                        for statement in statements:
+                            cursor.execute(statement)
+                        cursor.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                                       (version, name))
+                        logger.info(f"🧱 تم تطبيق الترحيل {version}: {name}")
+            return version
+        except Exception as e:
+            logger.error(f"❌ خطأ في ترحيل قاعدة البيانات: {e}")
+            return None
+    
+    @timed(DB_QUERY_SECONDS)
+    def create_or_update_user(self, user_id, username=None, first_name=None, last_name=None, invited_by=None):
+        """إنشاء أو تحديث المستخدم مع الدعوة ومكافأة الداعي في استعلام واحد ومعاملة واحدة
+
+        المكافأة تُمنح فقط إذا أُضيف صف الدعوة فعلاً (لم يكن المستخدم مدعواً من قبل)
+        وكان الداعي موجوداً وليس المستخدم نفسه.
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(f"""
+                        WITH upserted AS (
+                            INSERT INTO users (user_id, username, first_name, last_name, invited_by)
+                            VALUES (%(user_id)s, %(username)s, %(first_name)s, %(last_name)s, %(invited_by)s)
+                            ON CONFLICT (user_id) DO UPDATE SET
+                                username = COALESCE(EXCLUDED.username, users.username),
+                                first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+                                last_name = COALESCE(EXCLUDED.last_name, users.last_name),
+                                last_active = CURRENT_TIMESTAMP
+                            RETURNING {CHANGE_COLUMNS}
+                        ),
+                        referral AS (
+                            INSERT INTO referrals (referrer_id, referred_id)
+                            SELECT referrer.user_id, %(user_id)s
+                            FROM users AS referrer
+                            WHERE referrer.user_id = %(invited_by)s AND referrer.user_id <> %(user_id)s
+                            ON CONFLICT (referred_id) DO NOTHING
+                            RETURNING referrer_id
+                        ),
+                        rewarded AS (
+                            UPDATE users
+                            SET invited_count = invited_count + 1,
+                                balance = balance + {REFERRAL_REWARD}
+                            WHERE user_id IN (SELECT referrer_id FROM referral)
+                              AND invited_count < {MAX_REWARDED_INVITES}
+                            RETURNING {CHANGE_COLUMNS}
+                        )
+                        SELECT * FROM upserted
+                        UNION ALL
+                        SELECT * FROM rewarded
+                    """, {'user_id': user_id, 'username': username, 'first_name': first_name,
+                          'last_name': last_name, 'invited_by': invited_by})
+                    changed = cursor.fetchall()
+                    self._notify_changes(cursor, changed)
+            
+            logger.info(f"تم حفظ/تحديث المستخدم: {user_id}")
+            if len(changed) > 1:
+                logger.info(f"تمت إضافة دعوة: {invited_by} -> {user_id}")
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء/تحديث المستخدم: {e}")
+    
+    @timed(DB_QUERY_SECONDS)
+    def bulk_create_or_update_users(self, registrations):
+        """تسجيل دفعة من المستخدمين (مثلاً عند إعادة تشغيل تحديثات /start متراكمة)
+
+        registrations: قائمة قواميس بمفاتيح user_id, username, first_name, last_name, invited_by.
+        كل الدفعة في معاملة واحدة: upsert للمستخدمين ثم الدعوات والمكافآت.
+        """
+        user_rows, referral_rows = merge_registrations(registrations)
+        if not user_rows:
+            return True
+        
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    changed = execute_values(cursor, f"""
+                        INSERT INTO users (user_id, username, first_name, last_name, invited_by)
+                        VALUES %s
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            username = COALESCE(EXCLUDED.username, users.username),
+                            first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+                            last_name = COALESCE(EXCLUDED.last_name, users.last_name),
+                            last_active = CURRENT_TIMESTAMP
+                        RETURNING {CHANGE_COLUMNS}
+                    """, user_rows, page_size=len(user_rows), fetch=True)
+                    
+                    if referral_rows:
+                        changed += execute_values(cursor, f"""
+                            WITH input (referrer_id, referred_id) AS (VALUES %s),
+                            inserted AS (
+                                INSERT INTO referrals (referrer_id, referred_id)
+                                SELECT input.referrer_id, input.referred_id
+                                FROM input JOIN users AS referrer ON referrer.user_id = input.referrer_id
+                                ON CONFLICT (referred_id) DO NOTHING
+                                RETURNING referrer_id
+                            ),
+                            counts AS (
+                                SELECT referrer_id, COUNT(*) AS n FROM inserted GROUP BY referrer_id
+                            )
+                            UPDATE users
+                            SET invited_count = users.invited_count + counts.n,
+                                balance = users.balance + {REFERRAL_REWARD} * counts.n
+                            FROM counts
+                            WHERE users.user_id = counts.referrer_id
+                              AND users.invited_count < {MAX_REWARDED_INVITES}
+                            RETURNING {CHANGE_COLUMNS}
+                        """, referral_rows, template="(%s::bigint, %s::bigint)",
+                            page_size=len(referral_rows), fetch=True)
+                    self._notify_changes(cursor, changed)
+            
+            logger.info(f"تم حفظ/تحديث {len(user_rows)} مستخدم دفعة واحدة")
+            self._publish_changes(changed)
+            return True
+        except Exception as e:
+            logger.error(f"خطأ في التسجيل الجماعي للمستخدمين: {e}")
+            return False
+    
+    @timed(DB_QUERY_SECONDS, 'get_user')
+    def _load_user(self, user_id):
+        """قراءة المستخدم من قاعدة البيانات وتخزينه في الذاكرة المؤقتة"""
+        try:
+            token = self.user_cache.begin_load()
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    self._execute_prepared(cursor, 'get_user', (user_id,))
+                    result = cursor.fetchone()
+            if not result:
+                return None
+            user = dict(result)
+            self.user_cache.put(user_id, user, token)
+            return self._with_current_energy(user)
+        except Exception as e:
+            logger.error(f"خطأ في جلب بيانات المستخدم: {e}")
+            return None
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_bootstrap(self, user_id, with_rank=False):
+        """حالة اللعبة والترتيب والمهام والدعوات في استعلام واحد (None إذا لم يوجد اللاعب)"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    self._execute_prepared(cursor, 'get_bootstrap', (user_id, with_rank, utc_today()))
+                    row = cursor.fetchone()
+            return self._bootstrap_payload(row) if row else None
+        except Exception as e:
+            logger.error(f"خطأ في جلب حالة اللاعب: {e}")
+            return None
+    
+    @timed(DB_QUERY_SECONDS)
+    def update_game_data(self, user_id, balance=None, taps_today=None, energy=None, level=None, tap_power=None):
+        """تحديث بيانات اللعبة - استعلام واحد فقط"""
+        if balance is None and taps_today is None and energy is None and level is None and tap_power is None:
+            return
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    self._execute_prepared(
+                        cursor, 'update_game_data', (user_id, balance, taps_today, energy, level, tap_power)
+                    )
+                    changed = cursor.fetchall()
+                    self._notify_changes(cursor, changed)
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في تحديث بيانات اللعبة: {e}")
+    
+    @timed(DB_QUERY_SECONDS)
+    def bulk_update_game_data(self, updates):
+        """تحديث بيانات عدة لاعبين في استعلام UPDATE واحد ومعاملة واحدة
+
+        updates: قاموس {user_id: {الحقل: القيمة}}، والحقول الغائبة تبقى كما هي.
+        """
+        if not updates:
+            return
+        rows = [
+            (user_id, fields.get('balance'), fields.get('taps_today'), fields.get('energy'),
+             fields.get('level'), fields.get('tap_power'))
+            for user_id, fields in sorted(updates.items())
+        ]
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    # ترتيب الصفوف حسب user_id يقلل احتمال الـ deadlock مع التحديثات الأخرى
+                    # أعمدة v بأسماء مختلفة حتى تبقى أعمدة CHANGE_COLUMNS في RETURNING غير ملتبسة
+                    changed = execute_values(cursor, f"""
+                        UPDATE users AS u SET
+                            balance = COALESCE(v.new_balance, u.balance),
+                            taps_today = COALESCE(v.new_taps_today, u.taps_today),
+                            energy = COALESCE(v.new_energy, u.energy),
+                            energy_updated_at = CASE WHEN v.new_energy IS NULL
+                                                     THEN u.energy_updated_at ELSE CURRENT_TIMESTAMP END,
+                            level = COALESCE(v.new_level, u.level),
+                            tap_power = COALESCE(v.new_tap_power, u.tap_power),
+                            last_active = CURRENT_TIMESTAMP
+                        FROM (VALUES %s) AS v(target_id, new_balance, new_taps_today, new_energy,
+                                              new_level, new_tap_power)
+                        WHERE u.user_id = v.target_id
+                        RETURNING {CHANGE_COLUMNS}
+                    """, rows,
+                        template="(%s::bigint, %s::bigint, %s::int, %s::int, %s::int, %s::int)",
+                        page_size=len(rows), fetch=True)
+                    self._notify_changes(cursor, changed)
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في التحديث الجماعي لبيانات اللعبة: {e}")
+            raise
+    
+    @timed(DB_QUERY_SECONDS)
+    def apply_taps(self, user_id, taps, seq):
+        """تطبيق دفعة نقرات كزيادات ذرية - المستوى وقوة النقر يُحسبان على الخادم
+
+        تُرفض الدفعة إذا كان seq أقل من أو يساوي آخر رقم مطبّق، ويُقص عدد
+        النقرات حسب الطاقة المتاحة (المخزنة + التجدد منذ energy_updated_at).
+        قوة النقر المستخدمة هي قيمتها في بداية الدفعة.
+
+        None فقط للدفعة المكررة أو القديمة (أو لاعب غير موجود)؛ أخطاء القاعدة تُرفع
+        حتى لا يظن العميل أن نقراته طُبّقت فيحذفها.
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    self._execute_prepared(cursor, 'apply_taps', (user_id, taps, seq, utc_today()))
+                    result = cursor.fetchone()
+                    if result:
+                        self._notify_changes(cursor, [result])
+            if not result:
+                return None
+            self._publish_changes([result])
+            return dict(result)
+        except Exception as e:
+            logger.error(f"خطأ في تطبيق النقرات: {e}")
+            raise
+    
+    @timed(DB_QUERY_SECONDS)
+    def upsert_daily_stats(self, rows):
+        """إضافة فروقات النقرات والعملات إلى daily_stats و weekly_stats في معاملة واحدة
+
+        rows: قاموس {(user_id, date): (taps, coins)}
+        """
+        if not rows:
+            return
+        values = [(user_id, day, taps, coins) for (user_id, day), (taps, coins) in sorted(rows.items())]
+        weekly = [(user_id, week, taps, coins)
+                  for (user_id, week), (taps, coins) in sorted(weekly_rollup(rows).items())]
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, """
+                        INSERT INTO daily_stats (user_id, date, taps, coins_earned)
+                        VALUES %s
+                        ON CONFLICT (user_id, date) DO UPDATE SET
+                            taps = daily_stats.taps + EXCLUDED.taps,
+                            coins_earned = daily_stats.coins_earned + EXCLUDED.coins_earned
+                    """, values, page_size=len(values))
+                    # التجميع الأسبوعي يُحدّث تدريجياً بنفس الفروقات
+                    execute_values(cursor, """
+                        INSERT INTO weekly_stats (user_id, week, taps, coins_earned)
+                        VALUES %s
+                        ON CONFLICT (user_id, week) DO UPDATE SET
+                            taps = weekly_stats.taps + EXCLUDED.taps,
+                            coins_earned = weekly_stats.coins_earned + EXCLUDED.coins_earned
+                    """, weekly, page_size=len(weekly))
+                    # النسخ الأخرى تُسقط متصدري الفترات المحفوظة عندها
+                    self._notify_event(cursor, 'rollup')
+        except Exception as e:
+            logger.error(f"خطأ في كتابة الإحصائيات اليومية: {e}")
+            raise
+    
+    @timed(DB_QUERY_SECONDS)
+    def complete_tasks(self, completions):
+        """تسجيل دفعة مهام منجزة ومنح مكافآتها في استعلام واحد ومعاملة واحدة
+
+        completions: قاموس {(user_id, task_type): (reward, completed_at, period)} حيث period
+        اليوم للمهام اليومية أو None للمهام التي تُنجز مرة واحدة. المكافأة تُمنح فقط إذا
+        أُضيف صف المهمة أو أُعيد إنجازها في فترة أحدث - التكرار وإعادة المحاولة آمنان.
+        """
+        if not completions:
+            return
+        values = [(user_id, task_type, reward, completed_at, period)
+                  for (user_id, task_type), (reward, completed_at, period) in sorted(completions.items())]
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    changed = execute_values(cursor, f"""
+                        WITH done AS (
+                            INSERT INTO user_tasks AS t (user_id, task_type, completed, completed_at, reward, period)
+                            SELECT v.user_id, v.task_type, TRUE, v.completed_at, v.reward, v.period
+                            FROM (VALUES %s) AS v(user_id, task_type, reward, completed_at, period)
+                            JOIN users AS u ON u.user_id = v.user_id
+                            ON CONFLICT (user_id, task_type) DO UPDATE SET
+                                completed = TRUE,
+                                completed_at = EXCLUDED.completed_at,
+                                reward = EXCLUDED.reward,
+                                period = EXCLUDED.period
+                            WHERE NOT t.completed OR t.period < EXCLUDED.period
+                            RETURNING t.user_id, t.reward
+                        )
+                        UPDATE users AS u
+                        SET balance = u.balance + d.total_reward
+                        FROM (SELECT user_id AS rewarded_id, SUM(reward) AS total_reward
+                              FROM done GROUP BY user_id) AS d
+                        WHERE u.user_id = d.rewarded_id
+                        RETURNING {CHANGE_COLUMNS}
+                    """, values, template="(%s::bigint, %s, %s::int, %s::timestamp, %s::date)",
+                        page_size=len(values), fetch=True)
+                    self._notify_changes(cursor, changed)
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في تسجيل المهام المنجزة: {e}")
+            raise
+    
+    @timed(DB_QUERY_SECONDS)
+    def add_referral(self, referrer_id, referred_id):
+        """إضافة دعوة - المكافأة فقط إذا أُضيف صف الدعوة فعلاً"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    # فحص وإضافة وتحديث في عملية واحدة
+                    cursor.execute(f"""
+                        WITH referral AS (
+                            INSERT INTO referrals (referrer_id, referred_id)
+                            VALUES (%s, %s)
+                            ON CONFLICT (referred_id) DO NOTHING
+                            RETURNING referrer_id
+                        )
+                        UPDATE users 
+                        SET invited_count = invited_count + 1,
+                            balance = balance + {REFERRAL_REWARD}
+                        WHERE user_id IN (SELECT referrer_id FROM referral)
+                          AND invited_count < {MAX_REWARDED_INVITES}
+                        RETURNING {CHANGE_COLUMNS}
+                    """, (referrer_id, referred_id))
+                    changed = cursor.fetchall()
+                    self._notify_changes(cursor, changed)
+            
+            if changed:
+                logger.info(f"تمت إضافة دعوة: {referrer_id} -> {referred_id}")
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في إضافة الدعوة: {e}")
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_leaderboard(self, limit=10):
+        """جلب المتصدرين - استعلام محسّن"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    self._execute_prepared(cursor, 'get_leaderboard', (limit,))
+                    return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"خطأ في جلب المتصدرين: {e}")
+            return []
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_period_leaderboard(self, period, start, limit=100):
+        """أوائل فترة ('day' أو 'week') حسب العملات المكتسبة فيها - من جدول التجميع مباشرة"""
+        table, column = PERIOD_TABLES[period]
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(f"""
+                        SELECT s.user_id, u.username, u.first_name, u.level,
+                               s.coins_earned AS earned, s.taps
+                        FROM {table} AS s
+                        JOIN users AS u ON u.user_id = s.user_id
+                        WHERE s.{column} = %s
+                        ORDER BY s.coins_earned DESC, s.user_id
+                        LIMIT %s
+                    """, (start, limit))
+                    return [dict(row, rank=rank) for rank, row in enumerate(cursor.fetchall(), 1)]
+        except Exception as e:
+            logger.error(f"خطأ في جلب متصدري الفترة: {e}")
+            return None
+    
+    def get_ranking_rows(self, itersize=STREAM_ITERSIZE):
+        """توليد صفوف كل اللاعبين لبناء فهرس المتصدرين (server-side cursor)"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(name="ranking_rows") as cursor:
+                    cursor.itersize = itersize
+                    cursor.execute(f"SELECT {CHANGE_COLUMNS} FROM users")
+                    yield from cursor
+        except Exception as e:
+            logger.error(f"خطأ في جلب صفوف الترتيب: {e}")
+            raise
+    
+    def stream_users(self, columns=DEFAULT_USER_LIST_COLUMNS, itersize=STREAM_ITERSIZE):
+        """توليد المستخدمين (الأحدث أولاً) عبر server-side cursor بذاكرة ثابتة
+
+        الاتصال يبقى محجوزاً حتى انتهاء التكرار، لذلك يُفضل iter_users للمعالجة البطيئة.
+        """
+        select = _select_columns(columns)
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(name="stream_users", cursor_factory=RealDictCursor) as cursor:
+                    cursor.itersize = itersize
+                    cursor.execute(f"SELECT {select} FROM users ORDER BY created_at DESC")
+                    for row in cursor:
+                        yield dict(row)
+        except Exception as e:
+            logger.error(f"خطأ في جلب المستخدمين: {e}")
+            raise
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_users_after(self, after_id=0, limit=1000, columns=('user_id',)):
+        """صفحة من المستخدمين بترتيب user_id بعد after_id (ترقيم keyset)"""
+        select = _select_columns(columns, required=('user_id',))
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(f"""
+                        SELECT {select} FROM users
+                        WHERE user_id > %s
+                        ORDER BY user_id
+                        LIMIT %s
+                    """, (after_id, limit))
+                    return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"خطأ في جلب صفحة المستخدمين: {e}")
+            raise
+    
+    @timed(DB_QUERY_SECONDS)
+    def create_broadcast_job(self, message, created_by=None):
+        """إنشاء مهمة رسالة جماعية جديدة وإرجاع رقمها"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT INTO broadcast_jobs (message, created_by)
+                        VALUES (%s, %s)
+                        RETURNING id
+                    """, (message, created_by))
+                    return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء مهمة الإرسال: {e}")
+            return None
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_broadcast_job(self, job_id=None):
+        """جلب مهمة إرسال بالرقم، أو آخر مهمة إذا لم يُحدد الرقم"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    if job_id is None:
+                        cursor.execute("SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT 1")
+                    else:
+                        cursor.execute("SELECT * FROM broadcast_jobs WHERE id = %s", (job_id,))
+                    result = cursor.fetchone()
+                    return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"خطأ في جلب مهمة الإرسال: {e}")
+            return None
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_running_broadcast_jobs(self):
+        """جلب المهام التي لم تنته (للاستئناف عند التشغيل)"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute("SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+                    return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"خطأ في جلب مهام الإرسال: {e}")
+            return []
+    
+    @timed(DB_QUERY_SECONDS)
+    def save_broadcast_progress(self, job_id, last_user_id, sent, failed, status='running'):
+        """حفظ تقدم مهمة الإرسال"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE broadcast_jobs
+                        SET last_user_id = %s, sent = %s, failed = %s, status = %s,
+                            finished_at = CASE WHEN %s = 'running' THEN NULL ELSE CURRENT_TIMESTAMP END
+                        WHERE id = %s
+                    """, (last_user_id, sent, failed, status, status, job_id))
+        except Exception as e:
+            logger.error(f"خطأ في حفظ تقدم الإرسال: {e}")
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_aggregate_stats(self):
+        """إحصائيات إجمالية محسوبة بالكامل في SQL (بدون نقل الصفوف إلى Python)"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute("""
+                        SELECT
+                            COUNT(*) AS total_users,
+                            COALESCE(SUM(balance), 0)::bigint AS total_balance,
+                            COALESCE(SUM(total_taps), 0)::bigint AS total_taps,
+                            COUNT(*) FILTER (WHERE last_active >= NOW() - INTERVAL '24 hours') AS active_24h,
+                            COUNT(*) FILTER (WHERE last_active >= NOW() - INTERVAL '7 days') AS active_7d,
+                            COUNT(*) FILTER (WHERE created_at >= NOW() - INTERVAL '24 hours') AS new_24h,
+                            COUNT(*) FILTER (WHERE created_at >= NOW() - INTERVAL '7 days') AS new_7d
+                        FROM users
+                    """)
+                    stats = dict(cursor.fetchone())
+                    
+                    # توزيع المستويات على شرائح ثابتة
+                    cursor.execute("""
+                        SELECT CASE
+                                   WHEN level < 5 THEN '1-4'
+                                   WHEN level < 10 THEN '5-9'
+                                   WHEN level < 25 THEN '10-24'
+                                   WHEN level < 50 THEN '25-49'
+                                   WHEN level < 100 THEN '50-99'
+                                   ELSE '100+'
+                               END AS bucket,
+                               MIN(level) AS min_level,
+                               COUNT(*) AS users
+                        FROM users
+                        GROUP BY bucket
+                        ORDER BY min_level
+                    """)
+                    stats['level_distribution'] = [(row['bucket'], row['users']) for row in cursor.fetchall()]
+                    return stats
+        except Exception as e:
+            logger.error(f"خطأ في حساب الإحصائيات: {e}")
+            return None
+    
+    @timed(DB_QUERY_SECONDS)
+    def get_user_count(self):
+        """عد المستخدمين"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*) FROM users")
+                    return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"خطأ في عد المستخدمين: {e}")
+            return 0
+    
+    def pool_stats(self):
+        return self.connection_pool.stats() if self.connection_pool else None
+    
+    def close(self):
+        """إغلاق جميع الاتصالات"""
+        if self.connection_pool:
+            self.connection_pool.closeall()
@@ -0,0 +1,642 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+from storage import (
+    BaseDatabase, MAX_ENERGY, ENERGY_REGEN_PER_SECOND, REFERRAL_REWARD, MAX_REWARDED_INVITES,
+    CHANGE_COLUMNS, USER_COLUMNS, BOOTSTRAP_COLUMNS, DEFAULT_USER_LIST_COLUMNS, STREAM_ITERSIZE,
+    PERIOD_TABLES, _select_columns, merge_registrations, utc_today, weekly_rollup
+)
+from migrations import SQLITE_NOW, SCHEMA_VERSION, SCHEMA_VERSION_TABLE, pending_migrations
+from metrics import timed, DB_QUERY_SECONDS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # قراءة الملف عبر mmap
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", 64 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+# الأوقات تُخزن كنص UTC بدقة الملي ثانية - نفس صيغة القيم الافتراضية في المخطط
+NOW = SQLITE_NOW
+
+def _format_datetime(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def _parse_datetime(raw):
+    return datetime.fromisoformat(raw.decode()).replace(tzinfo=timezone.utc)
+
+sqlite3.register_adapter(datetime, _format_datetime)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter("TIMESTAMP", _parse_datetime)
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()))
+sqlite3.register_converter("BOOLEAN", lambda raw: raw not in (b'0', b''))
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+def sqlite_path(database_url):
+    """sqlite:///relative.db أو sqlite:////absolute/path.db -> مسار الملف"""
+    path = database_url.split(':', 1)[1]
+    if path.startswith('///'):
+        path = path[3:]
+    elif path.startswith('//'):
+        path = path[2:]
+    return path or 'clicker_game.db'
+
+class SQLiteDatabase(BaseDatabase):
+    """تخزين مدمج في ملف SQLite بوضع WAL - لنسخة واحدة من البوت بدون خادم قاعدة بيانات
+
+    لكل خيط اتصال خاص به: القراءات متوازية (WAL) بلا قفل وبلا شبكة، والكتابات
+    متسلسلة بقفل واحد داخل BEGIN IMMEDIATE. مع synchronous=NORMAL لا يُنتظر
+    fsync عند كل commit (فقط عند الـ checkpoint)، والدوال الجماعية تكتب كل
+    الدفعة في معاملة واحدة.
+    """
+
+    # OverflowError: عدد أكبر من INTEGER يُرفض عند الربط قبل الوصول لـ SQLite
+    DATA_ERRORS = (sqlite3.DataError, sqlite3.IntegrityError, OverflowError)
+
+    def __init__(self, database_url):
+        super().__init__()
+        self.database_url = database_url
+        self.path = sqlite_path(database_url)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _open(self):
+        # لا شيء يُفتح مسبقاً: لكل خيط اتصاله عند أول استخدام
+        pass
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES,
+                               isolation_level=None, check_same_thread=False)
+        conn.row_factory = _dict_row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+        conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _connection(self):
+        """اتصال الخيط الحالي (يُنشأ عند أول استخدام)"""
+        self.ensure_ready()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def get_connection(self):
+        """اتصال الخيط الحالي داخل معاملة كتابة - commit عند النجاح و rollback عند الخطأ"""
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception as e:
+                conn.execute("ROLLBACK")
+                logger.error(f"خطأ في الاتصال: {e}")
+                raise
+
+    @staticmethod
+    def _schema_version(conn):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone():
+            return conn.execute("SELECT COALESCE(MAX(version), 0) AS v FROM schema_version").fetchone()['v']
+        return 0
+
+    def init_database(self):
+        """ترحيل المخطط إلى SCHEMA_VERSION على اتصال مستقل - بدون أي DDL إذا كان محدّثاً"""
+        conn = None
+        try:
+            conn = self._connect()
+            version = self._schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                return version
+
+            with self._write_lock:
+                # BEGIN IMMEDIATE يمنع عملية أخرى على نفس الملف من الترحيل معنا
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    version = self._schema_version(conn)
+                    conn.execute(SCHEMA_VERSION_TABLE['sqlite'])
+                    for version, name, statements in pending_migrations(version, 'sqlite'):
+                        for statement in statements:
+                            conn.execute(statement)
+                        conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+                        logger.info(f"🧱 تم تطبيق الترحيل {version}: {name} ({self.path})")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            return version
+        except Exception as e:
+            logger.error(f"❌ خطأ في ترحيل قاعدة البيانات: {e}")
+            return None
+        finally:
+            if conn is not None:
+                conn.close()
+
+    # --- الكتابة ---
+
+    def _upsert_user(self, conn, user_id, username, first_name, last_name, invited_by):
+        return conn.execute(f"""
+            INSERT INTO users (user_id, username, first_name, last_name, invited_by)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                username = COALESCE(excluded.username, users.username),
+                first_name = COALESCE(excluded.first_name, users.first_name),
+                last_name = COALESCE(excluded.last_name, users.last_name),
+                last_active = {NOW}
+            RETURNING {CHANGE_COLUMNS}
+        """, (user_id, username, first_name, last_name, invited_by)).fetchall()
+
+    def _insert_referral(self, conn, referrer_id, referred_id):
+        """إضافة الدعوة ومكافأة الداعي فقط إذا أُضيف الصف فعلاً - يعيد الصفوف المتغيرة"""
+        inserted = conn.execute("""
+            INSERT INTO referrals (referrer_id, referred_id)
+            SELECT user_id, ? FROM users WHERE user_id = ?
+            ON CONFLICT (referred_id) DO NOTHING
+        """, (referred_id, referrer_id)).rowcount
+        if not inserted:
+            return []
+        return conn.execute(f"""
+            UPDATE users
+            SET invited_count = invited_count + 1,
+                balance = balance + {REFERRAL_REWARD}
+            WHERE user_id = ? AND invited_count < {MAX_REWARDED_INVITES}
+            RETURNING {CHANGE_COLUMNS}
+        """, (referrer_id,)).fetchall()
+
+    @timed(DB_QUERY_SECONDS)
+    def create_or_update_user(self, user_id, username=None, first_name=None, last_name=None, invited_by=None):
+        """إنشاء أو تحديث المستخدم مع الدعوة ومكافأة الداعي في معاملة واحدة"""
+        try:
+            with self.get_connection() as conn:
+                changed = self._upsert_user(conn, user_id, username, first_name, last_name, invited_by)
+                if invited_by is not None and invited_by != user_id:
+                    changed += self._insert_referral(conn, invited_by, user_id)
+
+            logger.info(f"تم حفظ/تحديث المستخدم: {user_id}")
+            if len(changed) > 1:
+                logger.info(f"تمت إضافة دعوة: {invited_by} -> {user_id}")
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء/تحديث المستخدم: {e}")
+
+    @timed(DB_QUERY_SECONDS)
+    def bulk_create_or_update_users(self, registrations):
+        """تسجيل دفعة من المستخدمين في معاملة واحدة"""
+        user_rows, referral_rows = merge_registrations(registrations)
+        if not user_rows:
+            return True
+        try:
+            changed = []
+            with self.get_connection() as conn:
+                for row in user_rows:
+                    changed += self._upsert_user(conn, *row)
+                for referrer_id, referred_id in referral_rows:
+                    changed += self._insert_referral(conn, referrer_id, referred_id)
+
+            logger.info(f"تم حفظ/تحديث {len(user_rows)} مستخدم دفعة واحدة")
+            self._publish_changes(changed)
+            return True
+        except Exception as e:
+            logger.error(f"خطأ في التسجيل الجماعي للمستخدمين: {e}")
+            return False
+
+    def _update_game_data(self, conn, user_id, balance, taps_today, energy, level, tap_power):
+        # NULL يعني "بدون تغيير" - نفس الشكل الثابت لكل الاستدعاءات (ذاكرة sqlite3 للعبارات)
+        return conn.execute(f"""
+            UPDATE users SET
+                balance = COALESCE(:balance, balance),
+                taps_today = COALESCE(:taps_today, taps_today),
+                energy = COALESCE(:energy, energy),
+                energy_updated_at = CASE WHEN :energy IS NULL THEN energy_updated_at ELSE {NOW} END,
+                level = COALESCE(:level, level),
+                tap_power = COALESCE(:tap_power, tap_power),
+                last_active = {NOW}
+            WHERE user_id = :user_id
+            RETURNING {CHANGE_COLUMNS}
+        """, {'user_id': user_id, 'balance': balance, 'taps_today': taps_today, 'energy': energy,
+              'level': level, 'tap_power': tap_power}).fetchall()
+
+    @timed(DB_QUERY_SECONDS)
+    def update_game_data(self, user_id, balance=None, taps_today=None, energy=None, level=None, tap_power=None):
+        """تحديث بيانات اللعبة - استعلام واحد فقط"""
+        if balance is None and taps_today is None and energy is None and level is None and tap_power is None:
+            return
+        try:
+            with self.get_connection() as conn:
+                changed = self._update_game_data(conn, user_id, balance, taps_today, energy, level, tap_power)
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في تحديث بيانات اللعبة: {e}")
+
+    @timed(DB_QUERY_SECONDS)
+    def bulk_update_game_data(self, updates):
+        """تحديث بيانات عدة لاعبين في معاملة واحدة
+
+        updates: قاموس {user_id: {الحقل: القيمة}}، والحقول الغائبة تبقى كما هي.
+        """
+        if not updates:
+            return
+        try:
+            changed = []
+            with self.get_connection() as conn:
+                for user_id, fields in sorted(updates.items()):
+                    changed += self._update_game_data(
+                        conn, user_id, fields.get('balance'), fields.get('taps_today'), fields.get('energy'),
+                        fields.get('level'), fields.get('tap_power')
+                    )
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في التحديث الجماعي لبيانات اللعبة: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS)
+    def apply_taps(self, user_id, taps, seq):
+        """تطبيق دفعة نقرات - نفس قواعد نسخة Postgres، محسوبة داخل معاملة الكتابة (والأخطاء تُرفع مثلها)"""
+        try:
+            with self.get_connection() as conn:
+                user = conn.execute("""
+                    SELECT balance, energy, energy_updated_at, tap_power, last_seq
+                    FROM users WHERE user_id = ?
+                """, (user_id,)).fetchone()
+                if user is None or user['last_seq'] >= seq:
+                    return None
+
+                now = datetime.now(timezone.utc)
+                updated_at = user['energy_updated_at'] or now
+                gained = max(int((now - updated_at).total_seconds() * ENERGY_REGEN_PER_SECOND), 0)
+                energy_now = min(user['energy'] + gained, MAX_ENERGY)
+                # عند امتلاء الطاقة يبدأ التجدد من الآن، وإلا نحتفظ بكسور الثانية
+                if user['energy'] + gained >= MAX_ENERGY:
+                    regen_from = now
+                else:
+                    regen_from = updated_at + timedelta(seconds=gained / ENERGY_REGEN_PER_SECOND)
+
+                tap_power = user['tap_power']
+                accepted = min(taps, energy_now // max(tap_power, 1))
+                earned = accepted * tap_power
+                new_level = (user['balance'] + earned) // 100 + 1
+                today = utc_today()
+                # أول دفعة في يوم جديد تصفّر taps_today وتمدّد أو تعيد سلسلة الأيام
+                result = conn.execute(f"""
+                    UPDATE users SET
+                        balance = balance + :earned,
+                        total_taps = total_taps + :accepted,
+                        taps_today = CASE WHEN taps_day = :today THEN taps_today ELSE 0 END + :accepted,
+                        taps_day = :today,
+                        streak_days = CASE WHEN taps_day = :today THEN streak_days
+                                           WHEN taps_day = :yesterday THEN streak_days + 1
+                                           ELSE 1 END,
+                        energy = :energy,
+                        energy_updated_at = :regen_from,
+                        level = MAX(level, :new_level),
+                        tap_power = MAX(tap_power, :new_level),
+                        last_seq = :seq,
+                        last_active = {NOW}
+                    WHERE user_id = :user_id
+                    RETURNING user_id, username, first_name, balance, taps_today,
+                              energy, level, tap_power, total_taps, streak_days
+                """, {'earned': earned, 'accepted': accepted, 'energy': energy_now - earned,
+                      'regen_from': regen_from, 'new_level': new_level, 'seq': seq,
+                      'today': today, 'yesterday': today - timedelta(days=1),
+                      'user_id': user_id}).fetchone()
+
+            result['accepted'] = accepted
+            result['earned'] = earned
+            self._publish_changes([result])
+            return result
+        except Exception as e:
+            logger.error(f"خطأ في تطبيق النقرات: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS)
+    def upsert_daily_stats(self, rows):
+        """إضافة فروقات النقرات والعملات إلى daily_stats و weekly_stats في معاملة واحدة
+
+        rows: قاموس {(user_id, date): (taps, coins)}
+        """
+        if not rows:
+            return
+        values = [(user_id, day, taps, coins) for (user_id, day), (taps, coins) in sorted(rows.items())]
+        weekly = [(user_id, week, taps, coins)
+                  for (user_id, week), (taps, coins) in sorted(weekly_rollup(rows).items())]
+        try:
+            with self.get_connection() as conn:
+                conn.executemany("""
+                    INSERT INTO daily_stats (user_id, date, taps, coins_earned)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id, date) DO UPDATE SET
+                        taps = taps + excluded.taps,
+                        coins_earned = coins_earned + excluded.coins_earned
+                """, values)
+                conn.executemany("""
+                    INSERT INTO weekly_stats (user_id, week, taps, coins_earned)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id, week) DO UPDATE SET
+                        taps = taps + excluded.taps,
+                        coins_earned = coins_earned + excluded.coins_earned
+                """, weekly)
+        except Exception as e:
+            logger.error(f"خطأ في كتابة الإحصائيات اليومية: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS)
+    def complete_tasks(self, completions):
+        """تسجيل دفعة مهام منجزة ومنح مكافآتها في معاملة واحدة
+
+        completions: قاموس {(user_id, task_type): (reward, completed_at, period)} - نفس
+        قواعد نسخة Postgres: المكافأة فقط لصف مهمة جديد أو إنجاز في فترة أحدث.
+        """
+        if not completions:
+            return
+        try:
+            rewards = {}
+            changed = []
+            with self.get_connection() as conn:
+                for (user_id, task_type), (reward, completed_at, period) in sorted(completions.items()):
+                    done = conn.execute("""
+                        INSERT INTO user_tasks (user_id, task_type, completed, completed_at, reward, period)
+                        SELECT user_id, :task_type, 1, :completed_at, :reward, :period
+                        FROM users WHERE user_id = :user_id
+                        ON CONFLICT (user_id, task_type) DO UPDATE SET
+                            completed = 1,
+                            completed_at = excluded.completed_at,
+                            reward = excluded.reward,
+                            period = excluded.period
+                        WHERE NOT completed OR period < excluded.period
+                        RETURNING reward
+                    """, {'user_id': user_id, 'task_type': task_type, 'reward': reward,
+                          'completed_at': completed_at, 'period': period}).fetchone()
+                    if done:
+                        rewards[user_id] = rewards.get(user_id, 0) + done['reward']
+                for user_id, reward in rewards.items():
+                    changed.append(conn.execute(
+                        f"UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING {CHANGE_COLUMNS}",
+                        (reward, user_id)
+                    ).fetchone())
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في تسجيل المهام المنجزة: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS)
+    def add_referral(self, referrer_id, referred_id):
+        """إضافة دعوة - المكافأة فقط إذا أُضيف صف الدعوة فعلاً"""
+        try:
+            with self.get_connection() as conn:
+                changed = self._insert_referral(conn, referrer_id, referred_id)
+
+            if changed:
+                logger.info(f"تمت إضافة دعوة: {referrer_id} -> {referred_id}")
+            self._publish_changes(changed)
+        except Exception as e:
+            logger.error(f"خطأ في إضافة الدعوة: {e}")
+
+    # --- القراءة: على اتصال الخيط مباشرة بدون قفل ---
+
+    @timed(DB_QUERY_SECONDS, 'get_user')
+    def _load_user(self, user_id):
+        """قراءة المستخدم من قاعدة البيانات وتخزينه في الذاكرة المؤقتة"""
+        try:
+            token = self.user_cache.begin_load()
+            user = self._connection().execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE user_id = ?",
+                                              (user_id,)).fetchone()
+            if not user:
+                return None
+            self.user_cache.put(user_id, user, token)
+            return self._with_current_energy(user)
+        except Exception as e:
+            logger.error(f"خطأ في جلب بيانات المستخدم: {e}")
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    def get_bootstrap(self, user_id, with_rank=False):
+        """حالة اللعبة والترتيب والمهام والدعوات في استعلام واحد (None إذا لم يوجد اللاعب)"""
+        try:
+            row = self._connection().execute(f"""
+                SELECT {', '.join('u.' + column for column in BOOTSTRAP_COLUMNS)},
+                       u.energy_updated_at, u.taps_day,
+                       (SELECT COUNT(*) FROM referrals AS r WHERE r.referrer_id = u.user_id) AS referrals,
+                       (SELECT json_group_object(t.task_type, t.completed AND (t.period IS NULL OR t.period >= :today))
+                        FROM user_tasks AS t WHERE t.user_id = u.user_id) AS tasks,
+                       CASE WHEN :with_rank THEN
+                           (SELECT COUNT(*) FROM users AS o WHERE o.balance > u.balance)
+                           + (SELECT COUNT(*) FROM users AS o WHERE o.balance = u.balance AND o.user_id < u.user_id)
+                           + 1
+                       END AS rank
+                FROM users AS u
+                WHERE u.user_id = :user_id
+            """, {'user_id': user_id, 'with_rank': with_rank, 'today': utc_today()}).fetchone()
+            if not row:
+                return None
+            row['tasks'] = json.loads(row['tasks']) if row['tasks'] else {}
+            return self._bootstrap_payload(row)
+        except Exception as e:
+            logger.error(f"خطأ في جلب حالة اللاعب: {e}")
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    def get_leaderboard(self, limit=10):
+        """جلب المتصدرين"""
+        try:
+            return self._connection().execute(f"""
+                SELECT {CHANGE_COLUMNS} FROM users ORDER BY balance DESC LIMIT ?
+            """, (limit,)).fetchall()
+        except Exception as e:
+            logger.error(f"خطأ في جلب المتصدرين: {e}")
+            return []
+
+    def _stream(self, query, itersize, as_tuples=False):
+        # اتصال مستقل حتى لا يُحجز اتصال الخيط طوال التكرار
+        self.ensure_ready()
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            if as_tuples:
+                cursor.row_factory = None
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            conn.close()
+
+    @timed(DB_QUERY_SECONDS)
+    def get_period_leaderboard(self, period, start, limit=100):
+        """أوائل فترة ('day' أو 'week') حسب العملات المكتسبة فيها - من جدول التجميع مباشرة"""
+        table, column = PERIOD_TABLES[period]
+        try:
+            rows = self._connection().execute(f"""
+                SELECT s.user_id, u.username, u.first_name, u.level,
+                       s.coins_earned AS earned, s.taps
+                FROM {table} AS s
+                JOIN users AS u ON u.user_id = s.user_id
+                WHERE s.{column} = ?
+                ORDER BY s.coins_earned DESC, s.user_id
+                LIMIT ?
+            """, (start, limit)).fetchall()
+            return [dict(row, rank=rank) for rank, row in enumerate(rows, 1)]
+        except Exception as e:
+            logger.error(f"خطأ في جلب متصدري الفترة: {e}")
+            return None
+
+    def get_ranking_rows(self, itersize=STREAM_ITERSIZE):
+        """توليد صفوف كل اللاعبين لبناء فهرس المتصدرين"""
+        try:
+            yield from self._stream(f"SELECT {CHANGE_COLUMNS} FROM users", itersize, as_tuples=True)
+        except Exception as e:
+            logger.error(f"خطأ في جلب صفوف الترتيب: {e}")
+            raise
+
+    def stream_users(self, columns=DEFAULT_USER_LIST_COLUMNS, itersize=STREAM_ITERSIZE):
+        """توليد المستخدمين (الأحدث أولاً) بذاكرة ثابتة"""
+        select = _select_columns(columns)
+        try:
+            yield from self._stream(f"SELECT {select} FROM users ORDER BY created_at DESC", itersize)
+        except Exception as e:
+            logger.error(f"خطأ في جلب المستخدمين: {e}")
+            raise
+
+    @timed(DB_QUERY_SECONDS)
+    def get_users_after(self, after_id=0, limit=1000, columns=('user_id',)):
+        """صفحة من المستخدمين بترتيب user_id بعد after_id (ترقيم keyset)"""
+        select = _select_columns(columns, required=('user_id',))
+        try:
+            return self._connection().execute(f"""
+                SELECT {select} FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?
+            """, (after_id, limit)).fetchall()
+        except Exception as e:
+            logger.error(f"خطأ في جلب صفحة المستخدمين: {e}")
+            raise
+
+    # --- الرسائل الجماعية ---
+
+    @timed(DB_QUERY_SECONDS)
+    def create_broadcast_job(self, message, created_by=None):
+        """إنشاء مهمة رسالة جماعية جديدة وإرجاع رقمها"""
+        try:
+            with self.get_connection() as conn:
+                return conn.execute(
+                    "INSERT INTO broadcast_jobs (message, created_by) VALUES (?, ?) RETURNING id",
+                    (message, created_by)
+                ).fetchone()['id']
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء مهمة الإرسال: {e}")
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    def get_broadcast_job(self, job_id=None):
+        """جلب مهمة إرسال بالرقم، أو آخر مهمة إذا لم يُحدد الرقم"""
+        try:
+            conn = self._connection()
+            if job_id is None:
+                return conn.execute("SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT 1").fetchone()
+            return conn.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+        except Exception as e:
+            logger.error(f"خطأ في جلب مهمة الإرسال: {e}")
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    def get_running_broadcast_jobs(self):
+        """جلب المهام التي لم تنته (للاستئناف عند التشغيل)"""
+        try:
+            return self._connection().execute(
+                "SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY id"
+            ).fetchall()
+        except Exception as e:
+            logger.error(f"خطأ في جلب مهام الإرسال: {e}")
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    def save_broadcast_progress(self, job_id, last_user_id, sent, failed, status='running'):
+        """حفظ تقدم مهمة الإرسال"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute(f"""
+                    UPDATE broadcast_jobs
+                    SET last_user_id = ?, sent = ?, failed = ?, status = ?,
+                        finished_at = CASE WHEN ? = 'running' THEN NULL ELSE {NOW} END
+                    WHERE id = ?
+                """, (last_user_id, sent, failed, status, status, job_id))
+        except Exception as e:
+            logger.error(f"خطأ في حفظ تقدم الإرسال: {e}")
+
+    # --- الإحصائيات ---
+
+    @timed(DB_QUERY_SECONDS)
+    def get_aggregate_stats(self):
+        """إحصائيات إجمالية محسوبة بالكامل في SQL"""
+        try:
+            conn = self._connection()
+            stats = conn.execute("""
+                SELECT
+                    COUNT(*) AS total_users,
+                    COALESCE(SUM(balance), 0) AS total_balance,
+                    COALESCE(SUM(total_taps), 0) AS total_taps,
+                    COUNT(*) FILTER (WHERE last_active >= strftime('%Y-%m-%d %H:%M:%f', 'now', '-24 hours')) AS active_24h,
+                    COUNT(*) FILTER (WHERE last_active >= strftime('%Y-%m-%d %H:%M:%f', 'now', '-7 days')) AS active_7d,
+                    COUNT(*) FILTER (WHERE created_at >= strftime('%Y-%m-%d %H:%M:%f', 'now', '-24 hours')) AS new_24h,
+                    COUNT(*) FILTER (WHERE created_at >= strftime('%Y-%m-%d %H:%M:%f', 'now', '-7 days')) AS new_7d
+                FROM users
+            """).fetchone()
+
+            # توزيع المستويات على شرائح ثابتة
+            rows = conn.execute("""
+                SELECT CASE
+                           WHEN level < 5 THEN '1-4'
+                           WHEN level < 10 THEN '5-9'
+                           WHEN level < 25 THEN '10-24'
+                           WHEN level < 50 THEN '25-49'
+                           WHEN level < 100 THEN '50-99'
+                           ELSE '100+'
+                       END AS bucket,
+                       MIN(level) AS min_level,
+                       COUNT(*) AS users
+                FROM users
+                GROUP BY bucket
+                ORDER BY min_level
+            """).fetchall()
+            stats['level_distribution'] = [(row['bucket'], row['users']) for row in rows]
+            return stats
+        except Exception as e:
+            logger.error(f"خطأ في حساب الإحصائيات: {e}")
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    def get_user_count(self):
+        """عد المستخدمين"""
+        try:
+            return self._connection().execute("SELECT COUNT(*) AS n FROM users").fetchone()['n']
+        except Exception as e:
+            logger.error(f"خطأ في عد المستخدمين: {e}")
+            return 0
+
+    def close(self):
+        """إغلاق جميع الاتصالات"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
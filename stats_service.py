@@ -0,0 +1,74 @@
+import os
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATS_REFRESH_SECONDS = float(os.getenv("STATS_REFRESH_SECONDS", 60))
+
+
+class StatsService:
+    """لقطة إحصائيات المشرف: تُحسب في SQL دورياً وتُقرأ من الذاكرة في وقت ثابت"""
+
+    def __init__(self, database, interval=STATS_REFRESH_SECONDS):
+        self.database = database
+        self.interval = interval
+        self.snapshot = None
+        self.refreshed_at = None
+        self.refresh_latency = 0.0
+        self.failures = 0  # إخفاقات متتالية - تحدد مهلة إعادة المحاولة
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """تشغيل خيط التحديث الدوري"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stats-service", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def refresh(self):
+        """إعادة حساب اللقطة - الطلبات المتزامنة تنتظر حساباً واحداً فقط"""
+        with self._lock:
+            started = time.perf_counter()
+            stats = self.database.get_aggregate_stats()
+            if stats is None:
+                return self.snapshot
+            self.refresh_latency = time.perf_counter() - started
+            self.snapshot = stats
+            self.refreshed_at = time.time()
+            return stats
+
+    def get(self):
+        """اللقطة الحالية، مع حسابها مرة واحدة إذا لم تُحسب بعد"""
+        return self.snapshot if self.snapshot is not None else self.refresh()
+
+    def age(self):
+        """عمر اللقطة بالثواني"""
+        return time.time() - self.refreshed_at if self.refreshed_at else None
+
+    def _next_wait(self):
+        """فوراً عند البدء، ثم كل interval - وبعد الإخفاق تراجع أسي من ثانية حتى interval"""
+        if self.failures:
+            return min(2 ** (self.failures - 1), self.interval)
+        return 0 if self.snapshot is None else self.interval
+
+    def _run(self):
+        while not self._stopping.wait(self._next_wait()):
+            refreshed_at = self.refreshed_at
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"خطأ في تحديث الإحصائيات: {e}")
+            # refresh يعيد اللقطة القديمة عند الفشل، فالنجاح يُعرف من تغيّر refreshed_at
+            self.failures = 0 if self.refreshed_at != refreshed_at else self.failures + 1
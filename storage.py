@@ -0,0 +1,288 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from cache import LRUCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+
+# الطاقة تُخزن كـ (energy, energy_updated_at) وتُحسب عند القراءة من الوقت المنقضي
+MAX_ENERGY = 1000
+ENERGY_REGEN_PER_SECOND = 1
+
+# مكافأة الدعوة والحد الأقصى للدعوات المكافأة
+REFERRAL_REWARD = 500
+MAX_REWARDED_INVITES = 999
+
+# الأعمدة التي تصل إلى مستمعي التغييرات (فهرس المتصدرين وغيره)
+CHANGE_COLUMNS = "user_id, username, first_name, balance, level, total_taps, invited_count"
+
+# الأعمدة المسموح بطلبها في استعلامات المستخدمين المتدفقة
+USER_COLUMNS = (
+    'user_id', 'username', 'first_name', 'last_name', 'balance', 'taps_today', 'energy',
+    'level', 'tap_power', 'total_taps', 'invited_by', 'invited_count', 'created_at',
+    'last_active', 'last_seq', 'energy_updated_at', 'taps_day', 'streak_days',
+)
+# جداول التجميع لكل فترة: الفترة -> (الجدول، عمود بداية الفترة)
+PERIOD_TABLES = {'day': ('daily_stats', 'date'), 'week': ('weekly_stats', 'week')}
+
+# حالة اللعبة فقط كما تحتاجها واجهة الويب عند الفتح (/api/bootstrap)
+BOOTSTRAP_COLUMNS = ('user_id', 'balance', 'taps_today', 'energy', 'level', 'tap_power', 'total_taps',
+                     'last_seq', 'invited_count', 'streak_days')
+DEFAULT_USER_LIST_COLUMNS = ('user_id', 'username', 'first_name', 'balance', 'level', 'created_at', 'last_active')
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", 2000))
+
+def _select_columns(columns, required=()):
+    """التحقق من الأعمدة المطلوبة (منع حقن SQL) وإرجاعها كنص للاستعلام"""
+    columns = tuple(columns)
+    unknown = [column for column in columns if column not in USER_COLUMNS]
+    if unknown:
+        raise ValueError(f"أعمدة غير معروفة: {unknown}")
+    columns = tuple(column for column in required if column not in columns) + columns
+    return ", ".join(columns)
+
+def utc_today():
+    """اليوم الحالي بتوقيت UTC - حدود الأيام للنقرات اليومية والمهام"""
+    return datetime.now(timezone.utc).date()
+
+def week_start(day):
+    """أول يوم (الاثنين) في أسبوع اليوم - مفتاح weekly_stats"""
+    return day - timedelta(days=day.weekday())
+
+def weekly_rollup(rows):
+    """{(user_id, date): (taps, coins)} -> {(user_id, week): (taps, coins)} لتحديث weekly_stats"""
+    weekly = {}
+    for (user_id, day), (taps, coins) in rows.items():
+        key = (user_id, week_start(day))
+        total = weekly.get(key, (0, 0))
+        weekly[key] = (total[0] + taps, total[1] + coins)
+    return weekly
+
+def current_energy(energy, energy_updated_at, now=None):
+    """الطاقة الحالية = المخزنة + التجدد منذ energy_updated_at (بحد أقصى MAX_ENERGY)"""
+    if energy_updated_at is None:
+        return min(energy, MAX_ENERGY)
+    now = now or datetime.now(timezone.utc)
+    elapsed = max((now - energy_updated_at).total_seconds(), 0)
+    return min(energy + int(elapsed * ENERGY_REGEN_PER_SECOND), MAX_ENERGY)
+
+def merge_registrations(registrations):
+    """دمج تسجيلات مكررة: آخر قيمة غير فارغة لكل حقل، وأول داعٍ لكل مستخدم
+
+    يعيد (صفوف المستخدمين، صفوف الدعوات) مرتبة حسب user_id:
+    (user_id, username, first_name, last_name, invited_by) و (referrer_id, referred_id).
+    """
+    users = {}
+    for registration in registrations:
+        user_id = int(registration['user_id'])
+        merged = users.setdefault(user_id, {'username': None, 'first_name': None,
+                                            'last_name': None, 'invited_by': None})
+        for field in ('username', 'first_name', 'last_name'):
+            if registration.get(field) is not None:
+                merged[field] = registration[field]
+        if merged['invited_by'] is None and registration.get('invited_by') is not None:
+            merged['invited_by'] = int(registration['invited_by'])
+
+    user_rows = [(user_id, u['username'], u['first_name'], u['last_name'], u['invited_by'])
+                 for user_id, u in sorted(users.items())]
+    referral_rows = [(u['invited_by'], user_id) for user_id, u in sorted(users.items())
+                     if u['invited_by'] is not None and u['invited_by'] != user_id]
+    return user_rows, referral_rows
+
+class BaseDatabase:
+    """الواجهة المشتركة لكل أنواع التخزين (Postgres و SQLite)
+
+    هنا ما لا يعتمد على قاعدة البيانات: مستمعو التغييرات، الذاكرة المؤقتة لـ
+    get_user، وحساب الطاقة. على كل نوع تخزين تعريف بقية الدوال بنفس التوقيع
+    والسلوك (قيم الإرجاع عند الخطأ وإبلاغ المستمعين بعد الـ commit).
+
+    الإنشاء لا يفتح أي اتصال: الاتصالات وترحيل المخطط يحدثان عند أول استخدام
+    (ensure_ready)، فاستيراد database رخيص للأدوات والسكربتات.
+    """
+
+    # الدوال الجماعية (bulk_update_game_data و upsert_daily_stats و complete_tasks) ترفع
+    # أخطاءها: المخزن المؤجل يحذف الصف فقط عند خطأ بيانات من هذه الأنواع (قيمة خارج
+    # النطاق أو قيد) ويعيد غيره للطابور (انقطاع الاتصال، مهلة الـ pool، deadlock)
+    DATA_ERRORS = ()
+
+    def __init__(self):
+        self._change_listeners = []
+        # ذاكرة مؤقتة لـ get_user تُبطل مع كل كتابة على اللاعب
+        self.user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self.add_change_listener(lambda user_id, row: self.user_cache.invalidate(user_id))
+        self._ready = False
+        self._ready_lock = threading.Lock()
+        self.schema_version = None
+        self.startup_seconds = None
+
+    def ensure_ready(self):
+        """فتح الاتصالات وترحيل المخطط عند أول استخدام (مرة واحدة لكل عملية)
+
+        إذا فشل الترحيل لا تُعلَّم القاعدة جاهزة، فيُعاد المحاولة مع الاستخدام التالي.
+        """
+        if self._ready:
+            return
+        with self._ready_lock:
+            if self._ready:
+                return
+            started = time.perf_counter()
+            self._open()
+            version = self.init_database()
+            if version is None:
+                return
+            self.schema_version = version
+            self.startup_seconds = time.perf_counter() - started
+            self._ready = True
+            logger.info(f"⏱️ قاعدة البيانات جاهزة خلال {self.startup_seconds * 1000:.0f} ms (المخطط v{version})")
+
+    def add_change_listener(self, callback):
+        """تسجيل دالة تُستدعى بعد كل تغيير مُثبت في بيانات لاعب: callback(user_id, row)"""
+        self._change_listeners.append(callback)
+
+    def _publish_changes(self, rows):
+        """إبلاغ المستمعين بالصفوف المتغيرة بعد الـ commit"""
+        for row in rows:
+            for callback in self._change_listeners:
+                try:
+                    callback(row['user_id'], row)
+                except Exception as e:
+                    logger.error(f"خطأ في مستمع التغييرات: {e}")
+
+    def get_user(self, user_id):
+        """جلب بيانات المستخدم - من الذاكرة المؤقتة إن وُجدت"""
+        user = self.get_cached_user(user_id)
+        if user is not None:
+            return user
+        return self._load_user(user_id)
+
+    def get_cached_user(self, user_id):
+        """المستخدم من الذاكرة المؤقتة فقط (بدون قاعدة البيانات) أو None"""
+        cached = self.user_cache.get(user_id)
+        return self._with_current_energy(cached) if cached is not None else None
+
+    @staticmethod
+    def _with_current_energy(user):
+        """نسخة من صف المستخدم مع الطاقة محسوبة للحظة الحالية"""
+        user = dict(user)
+        user['energy'] = current_energy(user['energy'], user.get('energy_updated_at'))
+        return user
+
+    @staticmethod
+    def _bootstrap_payload(row):
+        """صف get_bootstrap -> الحمولة: الطاقة محسوبة للحظة الحالية والمهام كـ {task_type: completed}"""
+        payload = {column: row[column] for column in BOOTSTRAP_COLUMNS}
+        payload['energy'] = current_energy(row['energy'], row['energy_updated_at'])
+        if row['taps_day'] != utc_today():
+            # نقرات يوم سابق - تُصفّر فعلياً مع أول دفعة نقرات اليوم
+            payload['taps_today'] = 0
+        payload['referrals'] = row['referrals']
+        payload['tasks'] = {task: bool(completed) for task, completed in (row['tasks'] or {}).items()}
+        if row.get('rank') is not None:
+            payload['rank'] = row['rank']
+        return payload
+
+    def get_all_users(self, columns=DEFAULT_USER_LIST_COLUMNS):
+        """جلب جميع المستخدمين - للقوائم الكبيرة استخدم stream_users أو iter_users"""
+        try:
+            return list(self.stream_users(columns=columns))
+        except Exception:
+            return []
+
+    def iter_users(self, after_id=0, batch=1000, columns=('user_id',)):
+        """توليد المستخدمين صفحة بعد صفحة - كل صفحة استعلام قصير على اتصال مستقل"""
+        while True:
+            page = self.get_users_after(after_id, batch, columns)
+            yield from page
+            if len(page) < batch:
+                return
+            after_id = page[-1]['user_id']
+
+    def pool_stats(self):
+        """إحصائيات الاتصالات إن وُجد pool (None لغير ذلك)"""
+        return None
+
+    # --- الدوال التي يعرّفها كل نوع تخزين ---
+
+    def _open(self):
+        """فتح موارد الاتصال (pool أو ملف) - يُستدعى مرة واحدة من ensure_ready"""
+        raise NotImplementedError
+
+    def get_connection(self):
+        raise NotImplementedError
+
+    def init_database(self):
+        """تطبيق الترحيلات المعلقة وإرجاع إصدار المخطط (None عند الفشل)"""
+        raise NotImplementedError
+
+    def create_or_update_user(self, user_id, username=None, first_name=None, last_name=None, invited_by=None):
+        raise NotImplementedError
+
+    def bulk_create_or_update_users(self, registrations):
+        raise NotImplementedError
+
+    def _load_user(self, user_id):
+        raise NotImplementedError
+
+    def update_game_data(self, user_id, balance=None, taps_today=None, energy=None, level=None, tap_power=None):
+        raise NotImplementedError
+
+    def bulk_update_game_data(self, updates):
+        raise NotImplementedError
+
+    def apply_taps(self, user_id, taps, seq):
+        raise NotImplementedError
+
+    def upsert_daily_stats(self, rows):
+        raise NotImplementedError
+
+    def complete_tasks(self, completions):
+        raise NotImplementedError
+
+    def get_period_leaderboard(self, period, start, limit=100):
+        raise NotImplementedError
+
+    def add_referral(self, referrer_id, referred_id):
+        raise NotImplementedError
+
+    def get_bootstrap(self, user_id, with_rank=False):
+        raise NotImplementedError
+
+    def get_leaderboard(self, limit=10):
+        raise NotImplementedError
+
+    def get_ranking_rows(self, itersize=STREAM_ITERSIZE):
+        raise NotImplementedError
+
+    def stream_users(self, columns=DEFAULT_USER_LIST_COLUMNS, itersize=STREAM_ITERSIZE):
+        raise NotImplementedError
+
+    def get_users_after(self, after_id=0, limit=1000, columns=('user_id',)):
+        raise NotImplementedError
+
+    def create_broadcast_job(self, message, created_by=None):
+        raise NotImplementedError
+
+    def get_broadcast_job(self, job_id=None):
+        raise NotImplementedError
+
+    def get_running_broadcast_jobs(self):
+        raise NotImplementedError
+
+    def save_broadcast_progress(self, job_id, last_user_id, sent, failed, status='running'):
+        raise NotImplementedError
+
+    def get_aggregate_stats(self):
+        raise NotImplementedError
+
+    def get_user_count(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
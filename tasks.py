@@ -0,0 +1,69 @@
+import os
+import logging
+import threading
+from collections import namedtuple
+from dotenv import load_dotenv
+from cache import LRUCache
+from storage import utc_today
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# عدد الإنجازات المُرسلة التي نتذكرها لمنع إرسالها مرة أخرى - ما يُنسى يُرفض في الـ upsert بلا مكافأة
+TASKS_RECORDED_SIZE = int(os.getenv("TASKS_RECORDED_SIZE", 100000))
+
+# field: العمود الذي يحمل التقدم في الصفوف المتغيرة، daily: تُنجز مرة كل يوم (UTC)
+Task = namedtuple('Task', 'task_type field target reward daily')
+
+# المهام كما تظهر في واجهة الويب (showTasks)
+TASKS = (
+    Task('tap_100', 'taps_today', 100, 500, daily=True),
+    Task('invite_3', 'invited_count', 3, 1000, daily=False),
+    Task('streak_7', 'streak_days', 7, 5000, daily=False),
+)
+
+
+class TaskEngine:
+    """تقييم تقدم المهام تدريجياً من الصفوف المتغيرة (change listener) بدون قراءة أي جدول
+
+    كل مهمة مرتبطة بعمود يصل مع التغيير نفسه: taps_today و streak_days من apply_taps
+    و invited_count من الدعوات، فالتقييم مقارنة لكل مهمة - O(1) لكل تغيير. الإنجاز
+    يُرسل إلى TaskCompletionBuffer، وذاكرة LRU محدودة (ليوم واحد) تمنع إرساله مرة
+    أخرى في نفس الفترة. ما يخرج منها أو يضيع بإعادة التشغيل يرفض الـ upsert تكراره
+    بدون مكافأة ثانية.
+    """
+
+    def __init__(self, buffer, tasks=TASKS, recorded_size=TASKS_RECORDED_SIZE):
+        self.buffer = buffer
+        self.tasks = tasks
+        self._by_field = {}
+        for task in tasks:
+            self._by_field.setdefault(task.field, []).append(task)
+        # (user_id, task_type, period) -> True - مفاتيح الأيام السابقة تنتهي صلاحيتها بعد يوم
+        self._recorded = LRUCache(recorded_size, ttl=24 * 3600)
+        self._lock = threading.Lock()
+
+        # إحصائيات للمراقبة
+        self.completed = 0
+
+    def apply_change(self, user_id, row):
+        """فحص المهام المرتبطة بالأعمدة الموجودة في الصف المتغير"""
+        for field, tasks in self._by_field.items():
+            value = row.get(field)
+            if value is None:
+                continue
+            for task in tasks:
+                if value >= task.target:
+                    self._complete(user_id, task)
+
+    def _complete(self, user_id, task):
+        period = utc_today() if task.daily else None
+        key = (user_id, task.task_type, period)
+        with self._lock:
+            if self._recorded.get(key) is not None:
+                return
+            self._recorded.put(key, True)
+            self.completed += 1
+        self.buffer.record(user_id, task.task_type, task.reward, period)
+        logger.info(f"📋 مهمة منجزة: {user_id} -> {task.task_type}")
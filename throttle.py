@@ -0,0 +1,113 @@
+import os
+import math
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+API_USER_RATE = int(os.getenv("API_USER_RATE", 30))  # أقصى عدد طلبات للاعب في النافذة
+API_USER_WINDOW = float(os.getenv("API_USER_WINDOW", 10))  # طول النافذة بالثواني
+API_DB_CONCURRENCY = int(os.getenv("API_DB_CONCURRENCY", 50))  # أقصى طلبات متزامنة تصل للقاعدة
+
+
+class SlidingWindowLimiter:
+    """حد الطلبات لكل مفتاح (user_id) في نافذة منزلقة - للاستخدام من حلقة الأحداث فقط
+
+    بدل حفظ وقت كل طلب يُحفظ عدّادان لكل مفتاح: النافذة الحالية والسابقة، ويُقدّر
+    عدد الطلبات في آخر window ثانية بوزن السابقة حسب الجزء المتبقي منها. الذاكرة
+    ثابتة لكل لاعب، والمفاتيح الخاملة تُحذف مرة كل نافذة.
+    """
+
+    def __init__(self, limit=API_USER_RATE, window=API_USER_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._counts = {}  # key -> [رقم النافذة، عدد الحالية، عدد السابقة]
+        self._last_sweep = time.monotonic()
+
+        # إحصائيات للمراقبة
+        self.allowed = 0
+        self.rejected = 0
+
+    def _state(self, key, index):
+        state = self._counts.get(key)
+        if state is None or state[0] < index - 1:
+            state = self._counts[key] = [index, 0, 0]
+        elif state[0] == index - 1:
+            state[0], state[1], state[2] = index, 0, state[1]
+        return state
+
+    def _retry_after(self, current, previous, offset):
+        """الثواني حتى يصبح طلب جديد مسموحاً (التقدير + 1 <= limit)"""
+        room = self.limit - 1
+        if current <= room and previous:
+            # داخل النافذة الحالية: ننتظر حتى يقل وزن السابقة بما يكفي
+            wait = (1 - (room - current) / previous) * self.window - offset
+        else:
+            # النافذة الحالية وحدها ممتلئة: ننتظر بداية التالية ثم يقل وزن هذه
+            wait = self.window - offset + max(1 - room / current, 0) * self.window if current else 0
+        return max(1, math.ceil(wait))
+
+    def hit(self, key, now=None):
+        """تسجيل طلب للمفتاح: يعيد 0 إذا كان مسموحاً، أو عدد الثواني قبل إعادة المحاولة"""
+        now = time.monotonic() if now is None else now
+        if now - self._last_sweep >= self.window:
+            self._sweep(now)
+
+        index, offset = divmod(now, self.window)
+        state = self._state(key, index)
+        estimated = state[2] * (1 - offset / self.window) + state[1]
+        if estimated + 1 > self.limit:
+            self.rejected += 1
+            return self._retry_after(state[1], state[2], offset)
+        state[1] += 1
+        self.allowed += 1
+        return 0
+
+    def _sweep(self, now):
+        """حذف المفاتيح التي لم تُستخدم منذ نافذتين (لا أثر لها على التقدير)"""
+        index = now // self.window
+        stale = [key for key, state in self._counts.items() if state[0] < index - 1]
+        for key in stale:
+            del self._counts[key]
+        self._last_sweep = now
+
+    def stats(self):
+        return {
+            'keys': len(self._counts),
+            'limit': self.limit,
+            'window': self.window,
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+        }
+
+
+class ConcurrencyLimiter:
+    """حد للطلبات المتزامنة بدون انتظار: الطلب الزائد يُرفض فوراً بدل الاصطفاف على الـ pool"""
+
+    def __init__(self, limit=API_DB_CONCURRENCY, retry_after=1):
+        self.limit = limit
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+        # إحصائيات للمراقبة
+        self.max_in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'limit': self.limit,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,131 @@
+"""خادم Bot API وهمي لتجربة البوت والرسائل الجماعية محلياً
+
+يرد على getMe و sendMessage وبقية الطرق بردود صالحة، ويمكنه محاكاة
+أخطاء تيليجرام: 429 مع retry_after، و 403 للمستخدمين الذين حظروا البوت.
+
+الاستخدام:
+    python tools/fake_bot_api.py --port 8081 --flood-every 500 --blocked-every 50
+    TELEGRAM_API_URL=http://localhost:8081 python bot.py
+"""
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot',
+            'can_join_groups': True, 'can_read_all_group_messages': False,
+            'supports_inline_queries': False}
+
+
+class FakeBotAPI:
+    def __init__(self, flood_every=0, retry_after=1, blocked_every=0, latency=0.0):
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.blocked_every = blocked_every
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.delivered = Counter()
+        self.sent_times = []
+
+    def handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+        if method == 'getUpdates':
+            time.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+            return 200, {'ok': True, 'result': []}
+        if method == 'sendMessage':
+            return self._send_message(params)
+        return 200, {'ok': True, 'result': True}
+
+    def _send_message(self, params):
+        chat_id = int(params['chat_id'])
+        with self.lock:
+            self.calls += 1
+            if self.flood_every and self.calls % self.flood_every == 0:
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f'Too Many Requests: retry after {self.retry_after}',
+                             'parameters': {'retry_after': self.retry_after}}
+            if self.blocked_every and chat_id % self.blocked_every == 0:
+                return 403, {'ok': False, 'error_code': 403,
+                             'description': 'Forbidden: bot was blocked by the user'}
+            self.delivered[chat_id] += 1
+            self.sent_times.append(time.monotonic())
+            message_id = sum(self.delivered.values())
+        return 200, {'ok': True, 'result': {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }}
+
+    def summary(self):
+        with self.lock:
+            duplicates = sum(1 for count in self.delivered.values() if count > 1)
+            elapsed = (self.sent_times[-1] - self.sent_times[0]) if len(self.sent_times) > 1 else 0
+            rate = (len(self.sent_times) - 1) / elapsed if elapsed else 0
+            return {'calls': self.calls, 'delivered_chats': len(self.delivered),
+                    'duplicate_chats': duplicates, 'messages_per_second': round(rate, 1)}
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+            if 'json' in self.headers.get('Content-Type', ''):
+                params = json.loads(body or b'{}')
+            else:
+                params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            method = self.path.rstrip('/').rsplit('/', 1)[-1]
+            status, payload = api.handle(method, params)
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(api, host='127.0.0.1', port=8081):
+    """تشغيل الخادم في خيط خلفي وإرجاعه (لاستخدامه من السكربتات)"""
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--flood-every', type=int, default=0, help='رد 429 كل N رسالة')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--blocked-every', type=int, default=0, help='رد 403 للمحادثات التي يقبل معرفها القسمة على N')
+    parser.add_argument('--latency', type=float, default=0.0, help='تأخير كل طلب بالثواني')
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.flood_every, args.retry_after, args.blocked_every, args.latency)
+    server = serve(api, args.host, args.port)
+    print(f"Fake Bot API on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(10)
+            print(api.summary())
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(api.summary())
+
+
+if __name__ == '__main__':
+    main()
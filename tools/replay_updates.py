@@ -0,0 +1,113 @@
+"""إعادة إرسال تحديثات تيليجرام مسجلة إلى مسار الـ webhook محلياً
+
+يقرأ التحديثات من ملف (JSON لكل سطر، أو مصفوفة JSON) أو يولّد أوامر
+اصطناعية، ثم يرسلها بالتوازي ويطبع توزيع الردود وزمن الاستجابة.
+
+الاستخدام:
+    python tools/fake_bot_api.py --port 8081 &
+    WEBHOOK_URL=http://localhost:5000 WEBHOOK_SECRET=s TELEGRAM_API_URL=http://localhost:8081 python bot.py &
+    python tools/replay_updates.py --secret s --generate 5000 --chats 200
+    python tools/replay_updates.py --secret s updates.jsonl
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+import aiohttp
+
+COMMANDS = ('/start', '/stats', '/leaderboard', '/help')
+
+
+def load_updates(path):
+    with open(path, encoding='utf-8') as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def generate_updates(count, chats, start_id=1):
+    """أوامر اصطناعية من محادثات خاصة - update_id متزايد كما يرسله تيليجرام"""
+    updates = []
+    now = int(time.time())
+    for index in range(count):
+        chat_id = 100000 + random.randrange(chats)
+        text = random.choice(COMMANDS)
+        updates.append({
+            'update_id': start_id + index,
+            'message': {
+                'message_id': index + 1,
+                'date': now,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}',
+                         'username': f'user{chat_id}'},
+                'text': text,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+            },
+        })
+    return updates
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def replay(url, updates, secret=None, concurrency=50):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    statuses = Counter()
+    latencies = []
+    position = iter(updates)
+
+    async def worker(session):
+        for update in position:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=update, headers=headers) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+            except aiohttp.ClientError:
+                statuses['error'] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'sent': len(updates),
+        'statuses': dict(statuses),
+        'updates_per_second': round(len(updates) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', nargs='?', help='ملف التحديثات (JSON لكل سطر أو مصفوفة)')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/telegram/webhook')
+    parser.add_argument('--secret', default=None)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--generate', type=int, default=0, help='توليد N أمر اصطناعي بدل قراءة ملف')
+    parser.add_argument('--chats', type=int, default=100, help='عدد المحادثات عند التوليد')
+    args = parser.parse_args()
+
+    if args.file:
+        updates = load_updates(args.file)
+    elif args.generate:
+        updates = generate_updates(args.generate, args.chats)
+    else:
+        parser.error('حدد ملف تحديثات أو --generate N')
+
+    print(asyncio.run(replay(args.url, updates, args.secret, args.concurrency)))
+
+
+if __name__ == '__main__':
+    main()
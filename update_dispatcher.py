@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 8))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+
+
+def update_chat_id(update):
+    """معرف المحادثة للتحديث (أو المستخدم إذا لم توجد محادثة) - مفتاح التوزيع"""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return update.update_id
+
+
+class UpdateDispatcher:
+    """طابور تحديثات محدود مع عمال متوازيين لوضع الـ webhook
+
+    كل محادثة توجَّه دائماً إلى نفس العامل (chat_id % workers)، لذلك تُعالج
+    تحديثات المحادثة الواحدة بالترتيب بينما تعمل المحادثات المختلفة بالتوازي.
+    عند امتلاء الطابور يُرفض التحديث فوراً ليعيد تيليجرام إرساله لاحقاً.
+    """
+
+    def __init__(self, application, workers=WEBHOOK_WORKERS, max_queue=WEBHOOK_QUEUE_SIZE):
+        self.application = application
+        self.workers = max(1, workers)
+        per_worker = max(1, max_queue // self.workers)
+        self._queues = [asyncio.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._tasks = []
+        self._closing = False
+
+        # إحصائيات للمراقبة
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_wait = 0.0
+
+    def start(self):
+        """تشغيل العمال"""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker(queue), name=f"update-worker-{index}")
+                for index, queue in enumerate(self._queues)
+            ]
+
+    async def stop(self, timeout=10):
+        """إنهاء التحديثات المنتظرة (بمهلة) ثم إيقاف العمال"""
+        self._closing = True
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ إيقاف العمال مع {self.queue_depth()} تحديث غير معالج")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, update):
+        """إضافة تحديث إلى طابور محادثته - يعيد False إذا كان الطابور ممتلئاً أو متوقفاً"""
+        if self._closing:
+            self.rejected += 1
+            return False
+        queue = self._queues[update_chat_id(update) % self.workers]
+        try:
+            queue.put_nowait((update, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, self.queue_depth())
+        return True
+
+    def queue_depth(self):
+        """عدد التحديثات المنتظرة في كل الطوابير"""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _worker(self, queue):
+        while True:
+            update, queued_at = await queue.get()
+            started = time.perf_counter()
+            try:
+                await self.application.process_update(update)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"خطأ في معالجة التحديث {update.update_id}: {e}")
+            finally:
+                latency = time.perf_counter() - started
+                self.processed += 1
+                self.total_wait += started - queued_at
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+                queue.task_done()
+
+    def stats(self):
+        """إحصائيات الطابور: العمق وزمن المعالجة"""
+        processed = self.processed or 1
+        return {
+            'queue_depth': self.queue_depth(),
+            'max_depth': self.max_depth,
+            'workers': self.workers,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'errors': self.errors,
+            'avg_wait_ms': round(self.total_wait / processed * 1000, 2),
+            'avg_latency_ms': round(self.total_latency / processed * 1000, 2),
+            'max_latency_ms': round(self.max_latency * 1000, 2),
+        }
@@ -0,0 +1,106 @@
+import os
+import gzip
+import hashlib
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:  # brotli اختياري - بدونه نقدم gzip فقط
+    brotli = None
+
+load_dotenv()
+
+WEBAPP_CACHE_MAX_AGE = int(os.getenv("WEBAPP_CACHE_MAX_AGE", 86400))
+
+
+def _parse_accept_encoding(header):
+    """تحويل Accept-Encoding إلى قاموس {الترميز: q}"""
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class PrecompressedAsset:
+    """محتوى ثابت يُضغط مرة واحدة (gzip و brotli) ويُقدَّم مع ETag قوي و 304"""
+
+    # ترتيب التفضيل عند قبول العميل لأكثر من ترميز
+    PREFERENCE = ('br', 'gzip', 'identity')
+
+    def __init__(self, body, content_type='text/html; charset=utf-8', max_age=WEBAPP_CACHE_MAX_AGE):
+        raw = body.encode('utf-8') if isinstance(body, str) else body
+        digest = hashlib.sha256(raw).hexdigest()[:32]
+        self.content_type = content_type
+        self.cache_control = f"public, max-age={max_age}"
+
+        self.variants = {'identity': raw, 'gzip': gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(raw, quality=11)
+
+        # ETag قوي مختلف لكل ترميز لأن البايتات مختلفة
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+            for encoding in self.variants
+        }
+
+    def negotiate(self, accept_encoding):
+        """اختيار أفضل ترميز يقبله العميل"""
+        accepted = _parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*')
+        for encoding in self.PREFERENCE:
+            if encoding not in self.variants:
+                continue
+            q = accepted.get(encoding, wildcard)
+            if encoding == 'identity' and q is None:
+                return encoding
+            if q:
+                return encoding
+        return 'identity'
+
+    def not_modified(self, if_none_match, encoding):
+        """هل لدى العميل نسخة حالية (If-None-Match) من الترميز الذي سيُقدَّم له
+
+        ETag ترميز آخر لا يكفي: العميل الذي خزّن نسخة gzip ثم صار يقبل br مثلاً يجب أن
+        يستلم البايتات الجديدة.
+        """
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == self.etags[encoding]:
+                return True
+        return False
+
+    def select(self, accept_encoding=None, if_none_match=None):
+        """إرجاع (status, body, headers) المناسبة للطلب"""
+        encoding = self.negotiate(accept_encoding)
+        headers = {
+            'Cache-Control': self.cache_control,
+            'ETag': self.etags[encoding],
+            'Vary': 'Accept-Encoding',
+        }
+        if self.not_modified(if_none_match, encoding):
+            return 304, b'', headers
+        headers['Content-Type'] = self.content_type
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, self.variants[encoding], headers
+
+    def sizes(self):
+        """حجم كل نسخة بالبايت"""
+        return {encoding: len(body) for encoding, body in self.variants.items()}
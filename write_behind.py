@@ -0,0 +1,268 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from storage import MAX_ENERGY
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SAVE_FLUSH_INTERVAL_MS = int(os.getenv("SAVE_FLUSH_INTERVAL_MS", 500))
+SAVE_FLUSH_MAX_USERS = int(os.getenv("SAVE_FLUSH_MAX_USERS", 1000))
+DAILY_STATS_FLUSH_INTERVAL_MS = int(os.getenv("DAILY_STATS_FLUSH_INTERVAL_MS", 5000))
+DAILY_STATS_FLUSH_MAX_KEYS = int(os.getenv("DAILY_STATS_FLUSH_MAX_KEYS", 5000))
+TASKS_FLUSH_INTERVAL_MS = int(os.getenv("TASKS_FLUSH_INTERVAL_MS", 1000))
+TASKS_FLUSH_MAX_KEYS = int(os.getenv("TASKS_FLUSH_MAX_KEYS", 1000))
+
+GAME_FIELDS = ('balance', 'taps_today', 'energy', 'level', 'tap_power')
+
+INT_MAX = 2 ** 31 - 1
+BIGINT_MAX = 2 ** 63 - 1
+# أقصى قيمة مقبولة لكل حقل (حدود الأعمدة) - قيمة واحدة خارجها كانت تُفشل الدفعة كلها
+FIELD_LIMITS = {'balance': BIGINT_MAX, 'taps_today': INT_MAX, 'energy': MAX_ENERGY,
+                'level': INT_MAX, 'tap_power': INT_MAX}
+
+
+class _PeriodicBuffer:
+    """أساس مشترك: تجميع في الذاكرة وتفريغ دوري (أو عند الامتلاء) من خيط خلفي
+
+    على الأصناف الفرعية تعريف _merge (دمج قيمة جديدة مع الموجودة) و _write
+    (كتابة الدفعة أو رفع خطأ القاعدة)، وخاصية database.
+
+    خطأ مؤقت (انقطاع، مهلة الـ pool، deadlock) يعيد الدفعة كلها للطابور. خطأ بيانات
+    (database.DATA_ERRORS) يعني أن صفاً فيها لا يمكن كتابته أبداً: تُكتب الصفوف
+    منفردة ويُحذف فقط ما يفشل بخطأ بيانات، بدل أن يُعاد للطابور ويُفشل كل دفعة بعده.
+    """
+
+    name = "buffer"
+
+    def __init__(self, interval_ms, max_keys):
+        self.interval = interval_ms / 1000
+        self.max_keys = max_keys
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # إحصائيات للمراقبة
+        self.flush_count = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    def _merge(self, existing, values):
+        raise NotImplementedError
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+    def start(self):
+        """تشغيل خيط التفريغ الدوري"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _add(self, key, values):
+        with self._lock:
+            existing = self._pending.get(key)
+            self._pending[key] = values if existing is None else self._merge(existing, values)
+            depth = len(self._pending)
+        if depth >= self.max_keys:
+            self._wake.set()
+
+    def queue_depth(self):
+        """عدد المفاتيح المنتظرة للكتابة"""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """كتابة كل ما في المخزن الآن"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = {}
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            error = self._try_write(batch)
+            latency = time.perf_counter() - started
+
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            if error is not None:
+                self.failed_flushes += 1
+                if not self._is_data_error(error):
+                    self._requeue(batch)
+                    return 0
+                written = self._write_rows(batch)
+                if written:
+                    self.flush_count += 1
+                    self.flushed_rows += written
+                return written
+
+            self.flush_count += 1
+            self.flushed_rows += len(batch)
+            return len(batch)
+
+    def _try_write(self, batch):
+        """None عند النجاح، وإلا الخطأ الذي رفعته القاعدة"""
+        try:
+            self._write(batch)
+            return None
+        except Exception as e:
+            return e
+
+    def _is_data_error(self, error):
+        return isinstance(error, self.database.DATA_ERRORS)
+
+    def _write_rows(self, batch):
+        """كتابة الدفعة صفاً صفاً بعد خطأ بيانات - يعيد عدد الصفوف المكتوبة
+
+        الصف الذي يفشل بخطأ بيانات يُحذف. عند خطأ مؤقت يعود هذا الصف وكل ما بعده
+        للطابور.
+        """
+        written = 0
+        rows = list(batch.items())
+        for index, (key, values) in enumerate(rows):
+            error = self._try_write({key: values})
+            if error is None:
+                written += 1
+            elif self._is_data_error(error):
+                logger.error(f"❌ حذف صف لا يمكن كتابته من {self.name}: {key} -> {values} ({error})")
+                self.dropped_rows += 1
+            else:
+                self._requeue(dict(rows[index:]))
+                break
+        return written
+
+    def _requeue(self, batch):
+        """إعادة الدفعة الفاشلة مع دمج ما وصل أثناء التفريغ"""
+        with self._lock:
+            for key, values in batch.items():
+                newer = self._pending.get(key)
+                self._pending[key] = values if newer is None else self._merge(values, newer)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"خطأ في تفريغ {self.name}: {e}")
+
+    def close(self, retries=3):
+        """إيقاف الخيط وتفريغ المخزن بالكامل قبل الإغلاق"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for _ in range(retries):
+            self.flush()
+            if not self.queue_depth():
+                break
+        remaining = self.queue_depth()
+        if remaining:
+            logger.error(f"❌ تعذر كتابة {remaining} عنصر من {self.name} عند الإغلاق")
+        else:
+            logger.info(f"✅ تم تفريغ {self.name} بالكامل")
+
+    def stats(self):
+        """إحصائيات المخزن: العمق وزمن التفريغ"""
+        return {
+            'queue_depth': self.queue_depth(),
+            'flush_count': self.flush_count,
+            'flushed_rows': self.flushed_rows,
+            'failed_flushes': self.failed_flushes,
+            'dropped_rows': self.dropped_rows,
+            'last_flush_latency_ms': round(self.last_flush_latency * 1000, 2),
+            'max_flush_latency_ms': round(self.max_flush_latency * 1000, 2),
+        }
+
+
+class SaveBuffer(_PeriodicBuffer):
+    """كتابة مؤجلة لحفظ اللعبة: آخر حالة لكل مستخدم تُكتب دفعة واحدة"""
+
+    name = "save-buffer"
+
+    def __init__(self, database, interval_ms=SAVE_FLUSH_INTERVAL_MS, max_users=SAVE_FLUSH_MAX_USERS):
+        super().__init__(interval_ms, max_users)
+        self.database = database
+
+    def submit(self, user_id, **fields):
+        """إضافة حالة لاعب إلى المخزن - الحقول الفارغة (None) لا تمسح القيم السابقة
+
+        ValueError إذا كانت قيمة سالبة أو أكبر من حد عمودها.
+        """
+        user_id = int(user_id)
+        if not -BIGINT_MAX <= user_id <= BIGINT_MAX:
+            raise ValueError(f"user_id خارج النطاق: {user_id}")
+        values = {name: int(fields[name]) for name in GAME_FIELDS if fields.get(name) is not None}
+        for name, value in values.items():
+            if not 0 <= value <= FIELD_LIMITS[name]:
+                raise ValueError(f"{name} خارج النطاق: {value}")
+        if values:
+            self._add(user_id, values)
+
+    def _merge(self, existing, values):
+        # الأحدث يكتب فوق الأقدم
+        return {**existing, **values}
+
+    def _write(self, batch):
+        return self.database.bulk_update_game_data(batch)
+
+
+class DailyStatsBuffer(_PeriodicBuffer):
+    """تجميع النقرات والعملات لكل (مستخدم، يوم) وكتابتها كـ upsert جماعي في daily_stats"""
+
+    name = "daily-stats"
+
+    def __init__(self, database, interval_ms=DAILY_STATS_FLUSH_INTERVAL_MS, max_keys=DAILY_STATS_FLUSH_MAX_KEYS):
+        super().__init__(interval_ms, max_keys)
+        self.database = database
+
+    def record(self, user_id, taps, coins, day=None):
+        """إضافة نقرات وعملات لليوم الحالي (UTC)"""
+        if taps <= 0 and coins <= 0:
+            return
+        day = day or datetime.now(timezone.utc).date()
+        self._add((int(user_id), day), (taps, coins))
+
+    def _merge(self, existing, values):
+        # الفروقات تُجمع
+        return (existing[0] + values[0], existing[1] + values[1])
+
+    def _write(self, batch):
+        return self.database.upsert_daily_stats(batch)
+
+
+class TaskCompletionBuffer(_PeriodicBuffer):
+    """تجميع المهام المنجزة وكتابتها مع مكافآتها في upsert جماعي واحد على user_tasks"""
+
+    name = "task-completions"
+
+    def __init__(self, database, interval_ms=TASKS_FLUSH_INTERVAL_MS, max_keys=TASKS_FLUSH_MAX_KEYS):
+        super().__init__(interval_ms, max_keys)
+        self.database = database
+
+    def record(self, user_id, task_type, reward, period=None):
+        """إضافة مهمة منجزة الآن - period اليوم للمهام اليومية و None لغيرها"""
+        self._add((int(user_id), task_type), (reward, datetime.now(timezone.utc), period))
+
+    def _merge(self, existing, values):
+        # الفترة الأحدث تكسب، وإلا يبقى الإنجاز الأول
+        if values[2] is not None and (existing[2] is None or values[2] > existing[2]):
+            return values
+        return existing
+
+    def _write(self, batch):
+        return self.database.complete_tasks(batch)